@@ -0,0 +1,261 @@
+"""
+Offline analytics over synced exam responses.
+
+Responses are loaded once into columnar NumPy arrays, one entry per answer (worker, question, answer, time spent),
+with worker ids, question ids and answers coded as integers; every statistic is then computed with bincount and
+array arithmetic instead of Python loops.
+"""
+import csv
+import json
+import os
+from array import array
+
+
+# Keys of a synced response read by AnswerTable, overridable with `cli.py analyze --field <key>=<name>`.
+RESPONSE_FIELDS = {
+    "worker": "worker_id",
+    "answers": "answers",
+    "question": "question_id",
+    "answer": "answer",
+    "time_spent": "time_spent",
+    "started": "started_at",
+    "finished": "finished_at",
+}
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ValueError("analyze requires the numpy package (pip install numpy)")
+    return numpy
+
+
+class Codes(object):
+    """
+    Interns values into consecutive integer codes.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def answer_key(answer):
+    # Answers of multiple-choice questions are strings; others (e.g. lists of spans) are compared by their JSON.
+    return answer if isinstance(answer, str) else json.dumps(answer, sort_keys=True)
+
+
+class AnswerTable(object):
+    """
+    Columns of all the answers of a set of responses, one row per answer.
+    fields: overrides of RESPONSE_FIELDS
+    """
+
+    def __init__(self, records, fields=None):
+        np = _numpy()
+        unknown = set(fields or {}) - set(RESPONSE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown response fields {', '.join(sorted(unknown))}, "
+                             f"expected some of {', '.join(RESPONSE_FIELDS)}")
+        fields = dict(RESPONSE_FIELDS, **(fields or {}))
+        worker_key, answers_key, question_key, answer_key_, time_key = \
+            fields['worker'], fields['answers'], fields['question'], fields['answer'], fields['time_spent']
+        self.workers = Codes()
+        self.questions = Codes()
+        self.answers = Codes()
+        worker, question, answer, time_spent = array('i'), array('i'), array('i'), array('d')
+        durations = array('d')
+        question_codes, answer_codes = self.questions.codes, self.answers.codes
+        nan = float('nan')
+        for position, record in enumerate(records):
+            if record.get(worker_key) is None or answers_key not in record:
+                raise ValueError(f"Response {position} lacks {worker_key} or {answers_key} "
+                                 f"(it has {', '.join(sorted(record))}); map them with --field")
+            answers = record.get(answers_key) or []
+            worker.extend([self.workers.code(record.get(worker_key))] * len(answers))
+            for a in answers:
+                if question_key not in a or answer_key_ not in a:
+                    raise ValueError(f"An answer of response {position} lacks {question_key} or {answer_key_} "
+                                     f"(it has {', '.join(sorted(a))}); map them with --field")
+                # The code dicts are looked up inline: this loop runs once per answer.
+                question_id = str(a[question_key])
+                code = question_codes.get(question_id)
+                question.append(self.questions.code(question_id) if code is None else code)
+                value = a[answer_key_]
+                code = answer_codes.get(value) if isinstance(value, str) else None
+                answer.append(self.answers.code(answer_key(value)) if code is None else code)
+                spent = a.get(time_key)
+                time_spent.append(nan if spent is None else float(spent))
+            durations.append(response_duration(record, fields['started'], fields['finished']))
+        self.worker = np.frombuffer(worker, dtype=np.int32)
+        self.question = np.frombuffer(question, dtype=np.int32)
+        self.answer = np.frombuffer(answer, dtype=np.int32)
+        self.time_spent = np.frombuffer(time_spent, dtype=np.float64)
+        self.durations = np.frombuffer(durations, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.worker)
+
+
+def response_duration(record, started_key="started_at", finished_key="finished_at"):
+    """
+    return: seconds between the start and the end of a response, NaN when either is missing
+    """
+    from datetime import datetime
+    try:
+        started = datetime.fromisoformat(str(record[started_key]).replace('Z', '+00:00'))
+        finished = datetime.fromisoformat(str(record[finished_key]).replace('Z', '+00:00'))
+    except (KeyError, ValueError):
+        return float('nan')
+    return (finished - started).total_seconds()
+
+
+def gold_answers(question_set):
+    """
+    return: question_id -> answer of the questions of a question set definition that have an "answer"
+    """
+    if isinstance(question_set, str):
+        question_set = json.loads(question_set)
+    return {str(q['question_id']): answer_key(q['answer'])
+            for q in question_set.get('questions', []) if q.get('answer') is not None}
+
+
+def analyze(table, gold=None, min_answers=1):
+    """
+    gold: question_id -> answer; questions without a gold answer are scored against their majority answer
+    return: {"summary": ..., "grades": [{"worker_id", "grade"}], "workers": [...], "questions": [...]},
+    grades being in the format of the exam reports read by `mturk_cli.py assign-qual`
+    """
+    np = _numpy()
+    if not len(table):
+        raise ValueError("No answers found in the responses")
+    num_workers, num_questions, num_answers = len(table.workers.values), len(table.questions.values), \
+        len(table.answers.values)
+
+    # votes[q, a]: how many times question q got answer a.
+    votes = np.bincount(table.question * num_answers + table.answer,
+                        minlength=num_questions * num_answers).reshape(num_questions, num_answers)
+    answered = votes.sum(axis=1)
+    reference = votes.argmax(axis=1)
+    has_gold = np.zeros(num_questions, dtype=bool)
+    for question_id, answer in (gold or {}).items():
+        q = table.questions.codes.get(question_id)
+        if q is not None:
+            reference[q] = table.answers.codes.get(answer, -1)
+            has_gold[q] = True
+
+    correct = (table.answer == reference[table.question]).astype(np.float64)
+    timed = ~np.isnan(table.time_spent)
+    time_spent = np.where(timed, table.time_spent, 0.0)
+
+    worker_answers = np.bincount(table.worker, minlength=num_workers)
+    worker_correct = np.bincount(table.worker, weights=correct, minlength=num_workers)
+    worker_accuracy = _ratio(worker_correct, worker_answers)
+    worker_mean_time = _ratio(np.bincount(table.worker, weights=time_spent, minlength=num_workers),
+                              np.bincount(table.worker, weights=timed, minlength=num_workers))
+
+    question_correct = np.bincount(table.question, weights=correct, minlength=num_questions)
+    question_accuracy = _ratio(question_correct, answered)
+    question_mean_time = _ratio(np.bincount(table.question, weights=time_spent, minlength=num_questions),
+                                np.bincount(table.question, weights=timed, minlength=num_questions))
+    # Share of the answers of a question agreeing with its most frequent answer.
+    question_agreement = _ratio(votes.max(axis=1), answered)
+
+    workers = [
+        {"worker_id": table.workers.values[w], "answers": int(worker_answers[w]),
+         "correct": int(worker_correct[w]), "accuracy": _float(worker_accuracy[w]),
+         "mean_time_spent": _float(worker_mean_time[w])}
+        for w in np.argsort(-worker_accuracy, kind="stable")
+    ]
+    questions = [
+        {"question_id": table.questions.values[q], "answers": int(answered[q]),
+         "reference_answer": table.answers.values[reference[q]] if reference[q] >= 0 else None,
+         "reference": "gold" if has_gold[q] else "majority",
+         "accuracy": _float(question_accuracy[q]), "difficulty": _float(1 - question_accuracy[q]),
+         "agreement": _float(question_agreement[q]),
+         "mean_time_spent": _float(question_mean_time[q])}
+        for q in range(num_questions)
+    ]
+    durations = table.durations[~np.isnan(table.durations)]
+    summary = {
+        "responses": len(table.durations),
+        "answers": len(table),
+        "workers": num_workers,
+        "questions": num_questions,
+        "gold_questions": int(has_gold.sum()),
+        "accuracy": _float(correct.mean()),
+        "fleiss_kappa": _float(fleiss_kappa(votes)),
+        "response_seconds": {
+            "mean": _float(durations.mean()) if len(durations) else None,
+            "p50": _float(np.percentile(durations, 50)) if len(durations) else None,
+            "p95": _float(np.percentile(durations, 95)) if len(durations) else None,
+        },
+    }
+    # Workers without an accuracy have no grade assign-qual could compare with a threshold.
+    grades = [{"worker_id": w["worker_id"], "grade": w["accuracy"]} for w in workers
+              if w["answers"] >= max(min_answers, 1) and w["accuracy"] is not None]
+    return {"summary": summary, "grades": grades, "workers": workers, "questions": questions}
+
+
+def fleiss_kappa(votes):
+    """
+    Fleiss' kappa of votes[item, category], over the items with at least two ratings.
+    return: kappa, or NaN when it is undefined
+    """
+    np = _numpy()
+    votes = votes[votes.sum(axis=1) >= 2].astype(np.float64)
+    if not len(votes):
+        return float('nan')
+    n = votes.sum(axis=1)
+    item_agreement = ((votes * (votes - 1)).sum(axis=1) / (n * (n - 1))).mean()
+    category_share = votes.sum(axis=0) / n.sum()
+    chance = (category_share ** 2).sum()
+    if chance >= 1:
+        return float('nan')
+    return (item_agreement - chance) / (1 - chance)
+
+
+def _ratio(numerator, denominator):
+    np = _numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+def _float(value):
+    value = float(value)
+    return None if value != value else round(value, 6)
+
+
+def write_json(result, path):
+    with open(path, "w") as output_fd:
+        json.dump(result, output_fd, indent=2)
+    return [path]
+
+
+def write_csv(result, folder):
+    """
+    return: paths of workers.csv, questions.csv and summary.json written into folder
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for name in ["workers", "questions"]:
+        rows = result[name]
+        path = os.path.join(folder, f"{name}.csv")
+        with open(path, "w", newline="") as output_fd:
+            writer = csv.DictWriter(output_fd, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+        paths.append(path)
+    path = os.path.join(folder, "summary.json")
+    with open(path, "w") as output_fd:
+        json.dump(result["summary"], output_fd, indent=2)
+    paths.append(path)
+    return paths
@@ -0,0 +1,125 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from client import Client, Instruction, Tutorial, QuestionSet, Question, Exam, TaskSet
+
+
+class AsyncClient(object):
+    """
+    asyncio front end for Client.
+
+    Calls are dispatched onto the pooled Client session from a bounded executor, so every
+    coroutine shares the same keep-alive connections, retries and URL building as the sync API.
+    At most `concurrency` requests are in flight at any time.
+    """
+
+    def __init__(self, config, concurrency=16, metrics=None):
+        config = dict(config)
+        http_config = dict(config.get('http', {}))
+        http_config['pool_maxsize'] = max(http_config.get('pool_maxsize', 0), concurrency)
+        config['http'] = http_config
+
+        self.client = Client(config, metrics=metrics)
+        self.site_url = self.client.site_url
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def run(self, fn, *args, **kwargs):
+        # The semaphore must be created inside the running loop.
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def get(self, url, **kwargs):
+        return await self.run(self.client.get, url, **kwargs)
+
+    async def post(self, url, data=None, **kwargs):
+        return await self.run(self.client.post, url, data=data, **kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AsyncResourceBase(object):
+    resource_class = None
+
+    def __init__(self, user, client):
+        self.user = user
+        self.client = client
+        self.resource = self.resource_class(user, client.client)
+
+    def get_url(self, name):
+        return self.resource.get_url(name)
+
+    def get_category_url(self):
+        return self.resource.get_category_url()
+
+    async def get(self, name):
+        return await self.client.run(self.resource.get, name)
+
+    async def update(self, name, definition):
+        return await self.client.run(self.resource.update, name, definition)
+
+    async def list(self):
+        return await self.client.run(self.resource.list)
+
+    async def get_many(self, names):
+        return await asyncio.gather(*[self.get(name) for name in names])
+
+    async def update_many(self, definitions):
+        """
+        definitions: dict of name -> definition
+        """
+        names = list(definitions.keys())
+        results = await asyncio.gather(*[self.update(name, definitions[name]) for name in names])
+        return dict(zip(names, results))
+
+
+class AsyncInstruction(AsyncResourceBase):
+    resource_class = Instruction
+
+
+class AsyncTutorial(AsyncResourceBase):
+    resource_class = Tutorial
+
+
+class AsyncQuestionSet(AsyncResourceBase):
+    resource_class = QuestionSet
+
+
+class AsyncExam(AsyncResourceBase):
+    resource_class = Exam
+
+    async def list_responses(self, name):
+        return await self.client.run(self.resource.list_responses, name)
+
+    async def get_responses(self, exam_id, response_ids, **kwargs):
+        return await self.client.run(self.resource.get_responses, exam_id, response_ids, **kwargs)
+
+    async def get_report(self, name):
+        return await self.client.run(self.resource.get_report, name)
+
+
+class AsyncQuestion(AsyncResourceBase):
+    resource_class = Question
+
+    def __init__(self, user, question_set_id, client):
+        self.user = user
+        self.question_set_id = question_set_id
+        self.client = client
+        self.resource = Question(user, question_set_id, client.client)
+
+
+class AsyncTaskSet(AsyncResourceBase):
+    resource_class = TaskSet
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Throughput and latency of the CrowdAQ client against the local stand-in in fake_crowdaq.py.
+
+python benchmarks/bench_client.py --sizes 1000,10000,100000 --latency 0.005 --error-rate 0.01 --json-out bench.json
+
+Every size starts its own fake_crowdaq.py process, so that the server does not compete with the client for the GIL.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from async_client import AsyncClient, AsyncInstruction  # noqa: E402
+from client import Client, Instruction, Exam  # noqa: E402
+import cli  # noqa: E402
+
+USER = "bench"
+EXAM_ID = "bench_exam"
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summarize(name, size, operations, elapsed, latencies):
+    result = {
+        "benchmark": name,
+        "responses": size,
+        "operations": operations,
+        "seconds": round(elapsed, 4),
+        "ops_per_second": round(operations / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+    }
+    print(f"{name:<22} {size:>8} {result['operations']:>8} {result['seconds']:>9.3f}s "
+          f"{result['ops_per_second']:>10.1f}/s p50 {result['p50_ms']:>8.2f}ms p95 {result['p95_ms']:>8.2f}ms")
+    return result
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def start_server(size, latency, error_rate):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "benchmarks", "fake_crowdaq.py"), "--port", "0",
+         "--responses", str(size), "--latency", str(latency), "--error-rate", str(error_rate)],
+        stdout=subprocess.PIPE, universal_newlines=True)
+    line = process.stdout.readline()
+    if not line:
+        raise ValueError("fake_crowdaq.py exited before serving")
+    return process, line.strip().rsplit(" ", 1)[-1]
+
+
+def bench_create(client, size, count):
+    resource = Instruction(USER, client)
+    definition = json.dumps({"document": "# Benchmark\n" + "x" * 1024})
+    latencies = [timed(resource.update, f"inst_{i}", definition) for i in range(count)]
+    return summarize("create", size, count, sum(latencies), latencies)
+
+
+def bench_create_async(config, size, count, concurrency):
+    definition = json.dumps({"document": "# Benchmark\n" + "x" * 1024})
+
+    async def run():
+        async with AsyncClient(config, concurrency=concurrency) as client:
+            resource = AsyncInstruction(USER, client)
+            latencies = []
+
+            async def create(i):
+                start = time.perf_counter()
+                await resource.update(f"inst_async_{i}", definition)
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(create(i) for i in range(count)))
+            return time.perf_counter() - start, latencies
+
+    elapsed, latencies = asyncio.run(run())
+    return summarize(f"create-async x{concurrency}", size, count, elapsed, latencies)
+
+
+def bench_list(client, size, count):
+    resource = Instruction(USER, client)
+    start = time.perf_counter()
+    latencies = [timed(resource.list) for _ in range(count)]
+    return summarize("list", size, count, time.perf_counter() - start, latencies)
+
+
+def bench_get_report(client, size, count):
+    resource = Exam(USER, client)
+    # The first call pays for building the report on the server.
+    resource.get_report(EXAM_ID)
+    start = time.perf_counter()
+    latencies = [timed(resource.get_report, EXAM_ID) for _ in range(count)]
+    return summarize("get-report", size, count, time.perf_counter() - start, latencies)
+
+
+def bench_sync_response(config_file, size, output_format, concurrency):
+    with tempfile.TemporaryDirectory() as output_folder:
+        args = ["-c", config_file, "--no-cache", "sync-response", f"exam/{USER}/{EXAM_ID}", output_folder,
+                "--format", output_format, "--concurrency", str(concurrency)]
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                elapsed = timed(cli.cli.main, args, standalone_mode=False)
+            finally:
+                sys.stdout = stdout
+    return summarize(f"sync-response {output_format}", size, size, elapsed, [elapsed])
+
+
+@click.command()
+@click.option("--sizes", default="1000,10000,100000", help="Comma separated numbers of exam responses.")
+@click.option("--requests", "num_requests", default=200, type=int,
+              help="Number of calls timed for create, list and get-report.")
+@click.option("--concurrency", default=16, type=int)
+@click.option("--latency", default=0.0, type=float, help="Seconds the server adds to every request.")
+@click.option("--error-rate", default=0.0, type=float, help="Fraction of requests the server answers with a 502.")
+@click.option("--json-out", default=None, help="Write the results to this file.")
+def main(sizes, num_requests, concurrency, latency, error_rate, json_out):
+    results = []
+    print(f"{'benchmark':<22} {'size':>8} {'ops':>8} {'time':>10} {'throughput':>12}")
+    for size in [int(s) for s in sizes.split(",")]:
+        process, site_url = start_server(size, latency, error_rate)
+        try:
+            config = {"site_url": site_url, "user": USER, "token": "bench", "cache": {"enabled": False}}
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as config_output:
+                json.dump(config, config_output)
+            client = Client(config)
+            results.append(bench_create(client, size, num_requests))
+            results.append(bench_create_async(config, size, num_requests, concurrency))
+            results.append(bench_list(client, size, num_requests))
+            results.append(bench_get_report(client, size, min(num_requests, 20)))
+            for output_format in ["json", "jsonl"]:
+                results.append(bench_sync_response(config_output.name, size, output_format, concurrency))
+            client.close()
+            os.remove(config_output.name)
+        finally:
+            process.terminate()
+            process.wait()
+
+    if json_out:
+        with open(json_out, "w") as output_fd:
+            json.dump({"latency": latency, "error_rate": error_rate, "results": results}, output_fd, indent=2)
+        print(f"Results written to {json_out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Time launch-task, expire-hit and assign-qual of mturk_cli.py against the in-process fake in fake_mturk.py.
+
+python benchmarks/bench_mturk.py --hits 2000 --workers 5000 --rate 20 --latency 0.02 --json-out bench_mturk.json
+
+--rate limits the fake to that many calls per second; calls beyond it are throttled and retried by call_with_backoff.
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout, redirect_stderr
+
+import click
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mturk_cli  # noqa: E402
+from fake_mturk import FakeMTurk, install  # noqa: E402
+
+QUAL_ID = "BENCHQUAL0000000000000000000000"
+
+
+def mturk_config_file(folder):
+    config = {
+        "mturk_config": {
+            "sandbox": False,
+            "reward_per_hit": 0.03,
+            "num_of_hits": 1,
+            "lifetime_min": "60*24",
+            "session_duration_min": "60",
+            "auto_approval_min": "60*24*7",
+            "require_master": False,
+            "require_US": False,
+            "other_qualifications": [
+                {"QualificationTypeId": QUAL_ID, "Comparator": "GreaterThanOrEqualTo", "IntegerValues": [50]},
+            ],
+        },
+        "meta": {"title": "Benchmark", "description": "Benchmark HIT", "keywords": "benchmark"},
+    }
+    config_file = os.path.join(folder, "mturk_config.json")
+    with open(config_file, "w") as output_fd:
+        json.dump(config, output_fd)
+    return config_file
+
+
+def run_command(fake, name, count, args, operation=None):
+    """
+    Run an mturk_cli command with its output discarded.
+    operation: MTurk operation whose number of calls is reported on its own, e.g. the HITs actually expired
+    return: benchmark result
+    """
+    before = fake.stats()
+    sys.stdin = io.StringIO("\n")
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            mturk_cli.cli.main(args, standalone_mode=False)
+    finally:
+        sys.stdin = sys.__stdin__
+    elapsed = time.perf_counter() - start
+    after = fake.stats()
+    result = {
+        "benchmark": name,
+        "items": count,
+        "seconds": round(elapsed, 4),
+        "items_per_second": round(count / elapsed, 2) if elapsed else 0.0,
+        "calls": after['calls'] - before['calls'],
+        "throttled": after['throttled'] - before['throttled'],
+    }
+    line = (f"{name:<28} {count:>8} {result['seconds']:>9.3f}s {result['items_per_second']:>10.1f}/s "
+            f"{result['calls']:>8} calls {result['throttled']:>8} throttled")
+    if operation:
+        result[f"{operation}_calls"] = \
+            after['by_operation'].get(operation, 0) - before['by_operation'].get(operation, 0)
+        line += f" {result[f'{operation}_calls']:>8} {operation}"
+    print(line)
+    return result
+
+
+@click.command()
+@click.option("--hits", default=2000, type=int, help="Number of HITs launched and expired.")
+@click.option("--workers", default=5000, type=int, help="Number of workers in the exam report.")
+@click.option("--concurrency", default=8, type=int)
+@click.option("--rate", default=None, type=float, help="Calls per second the fake accepts before throttling.")
+@click.option("--burst", default=None, type=int, help="Calls the fake accepts at once. Defaults to --rate.")
+@click.option("--latency", default=0.0, type=float, help="Seconds every call takes.")
+@click.option("--json-out", default=None, help="Write the results to this file.")
+def main(hits, workers, concurrency, rate, burst, latency, json_out):
+    fake = install(FakeMTurk(rate=rate, burst=burst, latency=latency))
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        config_file = mturk_config_file(folder)
+        url_file = os.path.join(folder, "urls.txt")
+        with open(url_file, "w") as output_fd:
+            output_fd.writelines(f"https://crowdaq.example/task/bench/{i}\n" for i in range(hits))
+        logdir = os.path.join(folder, "logs")
+        os.makedirs(logdir)
+
+        print(f"{'benchmark':<28} {'items':>8} {'time':>10} {'throughput':>12}")
+        results.append(run_command(fake, "launch-task", hits, [
+            "launch-task", config_file, "--url_file", url_file, "--logdir", logdir,
+            "--concurrency", str(concurrency)]))
+
+        group_id = next(iter(fake.hits.values()))['HITGroupId']
+        index_path = os.path.join(folder, "hits.sqlite")
+        expire = mturk_cli.expire_hit_group.name
+        variants = [
+            ("list", ["--clean"]),
+            ("qualid", ["--clean", "--qualid", QUAL_ID]),
+            ("index", ["--clean", "--use-index", "--index-path", index_path]),
+            ("logdir", ["--logdir", logdir]),
+        ]
+        for variant, options in variants:
+            # Every variant expires the same --hits live HITs, not the ones the previous variant expired.
+            fake.reset_expiration()
+            results.append(run_command(fake, f"{expire} {variant}", hits, [
+                expire, group_id, *options, "--concurrency", str(concurrency)], operation="UpdateExpirationForHIT"))
+
+        report_file = os.path.join(folder, "report.json")
+        with open(report_file, "w") as output_fd:
+            json.dump({"grades": [{"worker_id": f"W{i:06d}", "grade": (i % 100) / 100} for i in range(workers)]},
+                      output_fd)
+        passing = sum(1 for i in range(workers) if (i % 100) / 100 >= 0.5)
+        results.append(run_command(fake, "assign-qual", passing, [
+            "assign-qual", QUAL_ID, report_file, "0.5", "--concurrency", str(concurrency)]))
+        results.append(run_command(fake, "assign-qual --sync", passing, [
+            "assign-qual", QUAL_ID, report_file, "0.5", "--sync", "--concurrency", str(concurrency)]))
+        with open(report_file, "w") as output_fd:
+            json.dump({"grades": [{"worker_id": f"W{i:06d}", "grade": ((i + 1) % 100) / 100}
+                                  for i in range(workers)]}, output_fd)
+        results.append(run_command(fake, "assign-qual --sync --revoke", passing, [
+            "assign-qual", QUAL_ID, report_file, "0.5", "--sync", "--revoke", "--concurrency", str(concurrency)]))
+
+    if json_out:
+        with open(json_out, "w") as output_fd:
+            json.dump({"rate": rate, "latency": latency, "concurrency": concurrency, "results": results},
+                      output_fd, indent=2)
+        print(f"Results written to {json_out}")
+
+
+if __name__ == '__main__':
+    main()
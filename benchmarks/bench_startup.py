@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Cold start of cli.py and mturk_cli.py.
+
+python benchmarks/bench_startup.py --runs 5 --budget-ms 100
+
+For every CLI module this measures its cumulative import time with -X importtime and the wall clock of `--help`,
+and checks that none of the heavy dependencies (requests, boto3, tqdm, ...) is imported before a command needs it.
+Exits with status 1 when the median import time exceeds the budget or a heavy dependency is imported eagerly.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_MODULES = ["cli", "mturk_cli"]
+HEAVY_MODULES = ["requests", "urllib3", "boto3", "botocore", "tqdm", "sqlite3", "xml.etree.ElementTree", "numpy"]
+
+
+def import_times(module):
+    """
+    return: dict of the modules imported by `import module`, itself included -> cumulative import time in microseconds
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=REPO_DIR, stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+        # Children are listed before their parent; a top level import other than the module (e.g. site at
+        # interpreter startup) closes a subtree that is not ours.
+        if not name[1:].startswith(" ") and name.strip() != module:
+            times = {}
+    return times
+
+
+def eager_heavy_modules(module):
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+    return output.split()
+
+
+def help_wall_clock(module):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, f"{module}.py", "--help"], cwd=REPO_DIR, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option("--runs", default=5, type=int)
+@click.option("--budget-ms", default=100.0, type=float, help="Maximum median cumulative import time of a CLI module.")
+@click.option("--top", default=8, type=int, help="Number of slowest imports listed per module.")
+@click.option("--json-out", default=None, help="Write the results to this file.")
+def main(runs, budget_ms, top, json_out):
+    results = []
+    failed = False
+    for module in CLI_MODULES:
+        # The first run compiles changed modules, so it does not count.
+        import_times(module)
+        samples = [import_times(module) for _ in range(runs)]
+        import_ms = statistics.median(s[module] for s in samples) / 1000
+        help_ms = statistics.median(help_wall_clock(module) for _ in range(runs)) * 1000
+        eager = eager_heavy_modules(module)
+
+        print(f"{module}: import {import_ms:.1f}ms (budget {budget_ms:.0f}ms), `{module}.py --help` {help_ms:.1f}ms")
+        slowest = sorted(samples[-1].items(), key=lambda item: -item[1])
+        for name, micros in [item for item in slowest if item[0] != module][:top]:
+            print(f"  {micros / 1000:8.1f}ms  {name}")
+        if import_ms > budget_ms:
+            print(f"  [FAIL] import time is over budget")
+            failed = True
+        if eager:
+            print(f"  [FAIL] imported at startup: {', '.join(eager)}")
+            failed = True
+        results.append({"module": module, "import_ms": import_ms, "help_ms": help_ms, "eager_imports": eager})
+
+    if json_out:
+        with open(json_out, "w") as output_fd:
+            json.dump({"budget_ms": budget_ms, "results": results}, output_fd, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the CrowdAQ API endpoints used by client.py and cli.py.
+
+python benchmarks/fake_crowdaq.py --port 10001 --responses 10000 --latency 0.01 --error-rate 0.01
+
+Resources are kept in memory. Exam responses and task reports are generated on the fly from their ids,
+so large datasets cost no memory.
+"""
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import click
+
+NAME = r"[a-zA-Z0-9_][a-zA-Z0-9-_]*"
+RESOURCE_TYPES = ["instruction", "tutorial", "question_set", "exam", "task"]
+QUESTIONS_PER_EXAM = 10
+# Bodies smaller than this are sent uncompressed even when the client accepts gzip.
+GZIP_MIN_BYTES = 1024
+OPTIONS = "ABCD"
+
+
+def make_response(exam_id, pid, num_workers):
+    rng = random.Random(f"{exam_id}-{pid}")
+    started = datetime(2020, 1, 1) + timedelta(seconds=pid * 37)
+    answers = []
+    for q in range(QUESTIONS_PER_EXAM):
+        # Question q has gold answer OPTIONS[q % 4]; later questions are harder.
+        correct = rng.random() > 0.1 + 0.05 * q
+        answers.append({
+            "question_id": str(q + 1),
+            "answer": OPTIONS[q % 4] if correct else rng.choice(OPTIONS),
+            "time_spent": round(rng.uniform(2, 60), 2),
+        })
+    return {
+        "pid": pid,
+        "exam_id": exam_id,
+        "worker_id": f"W{rng.randrange(num_workers):06d}",
+        "started_at": started.isoformat(),
+        "finished_at": (started + timedelta(seconds=sum(a['time_spent'] for a in answers))).isoformat(),
+        "answers": answers,
+    }
+
+
+class FakeCrowdAQ(object):
+    def __init__(self, responses=1000, tasks=100, workers=None, latency=0.0, error_rate=0.0, seed=0):
+        self.responses = responses
+        self.tasks = tasks
+        self.workers = workers or max(1, responses // 5)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.resources = {}
+        self.assignment_counts = {}
+        self.reports = {}
+        self.stats = {"requests": 0, "errors_injected": 0}
+
+    def task_report(self, user, task):
+        with self.lock:
+            counts = self.assignment_counts.setdefault((user, task), [0] * self.tasks)
+            return {"assignment_count": [{"task_id": f"task_{i}", "count": c} for i, c in enumerate(counts)]}
+
+    def exam_report(self, exam_id):
+        with self.lock:
+            if exam_id in self.reports:
+                return self.reports[exam_id]
+        grades = {}
+        for pid in range(self.responses):
+            record = make_response(exam_id, pid, self.workers)
+            score = sum(a['answer'] == OPTIONS[i % 4] for i, a in enumerate(record['answers'])) / QUESTIONS_PER_EXAM
+            grades[record['worker_id']] = max(score, grades.get(record['worker_id'], 0))
+        report = {"grades": [{"worker_id": w, "grade": g} for w, g in sorted(grades.items())]}
+        with self.lock:
+            self.reports[exam_id] = report
+        return report
+
+    def add_assignments(self, user, task, count=1):
+        with self.lock:
+            counts = self.assignment_counts.setdefault((user, task), [0] * self.tasks)
+            for _ in range(count):
+                counts[self.rng.randrange(len(counts))] += 1
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without TCP_NODELAY every keep-alive request
+        # waits for the client's delayed ACK.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, obj, status=200, headers=None):
+            body = json.dumps(obj).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_status(self, status, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+
+        def read_body(self):
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().split(b";")[0], 16)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+                    if size == 0:
+                        break
+                body = b"".join(chunks)
+            else:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            return body
+
+        def before(self):
+            with state.lock:
+                state.stats["requests"] += 1
+            if state.latency:
+                time.sleep(state.latency)
+            if state.error_rate and state.rng.random() < state.error_rate:
+                with state.lock:
+                    state.stats["errors_injected"] += 1
+                self.send_json({"error": "injected"}, status=502)
+                return False
+            return True
+
+        def do_GET(self):
+            if not self.before():
+                return
+            path = urlparse(self.path).path
+
+            m = re.match(rf"^/api/exam/({NAME})/({NAME})/response(?:/([0-9-]+))?$", path)
+            if m:
+                user, exam_id, ids = m.groups()
+                if ids is None:
+                    return self.send_json({"results": list(range(state.responses))})
+                records = [make_response(exam_id, int(pid), state.workers) for pid in ids.split("-")
+                           if int(pid) < state.responses]
+                return self.send_json({"results": records})
+
+            m = re.match(rf"^/api/exam/({NAME})/({NAME})/report$", path)
+            if m:
+                return self.send_json(state.exam_report(m.group(2)))
+
+            m = re.match(rf"^/api/task_report/({NAME})/({NAME})$", path)
+            if m:
+                report = state.task_report(*m.groups())
+                etag = '"' + hashlib.sha1(json.dumps(report).encode('utf-8')).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self.send_status(304, {"ETag": etag})
+                return self.send_json(report, headers={"ETag": etag})
+
+            m = re.match(rf"^/api/task_assignment/({NAME})/({NAME})$", path)
+            if m:
+                report = state.task_report(*m.groups())
+                return self.send_json({"results": [t['task_id'] for t in report['assignment_count']]})
+
+            m = re.match(rf"^/api/({'|'.join(RESOURCE_TYPES)})/({NAME})(?:/({NAME}))?(/questions)?(?:/({NAME}))?$",
+                         path)
+            if m:
+                resource_type, user, name, questions, question_id = m.groups()
+                with state.lock:
+                    if name is None or (questions and question_id is None):
+                        prefix = "" if name is None else f"{name}/"
+                        return self.send_json([{"name": n[len(prefix):]} for (t, u, n) in sorted(state.resources)
+                                               if t == resource_type and u == user and n.startswith(prefix)
+                                               and "/" not in n[len(prefix):]])
+                    key = (resource_type, user, name if question_id is None else f"{name}/{question_id}")
+                    definition = state.resources.get(key)
+                if definition is None:
+                    return self.send_json({"error": "not found"}, status=404)
+                etag = '"' + hashlib.sha1(definition).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self.send_status(304, {"ETag": etag})
+                return self.send_json(json.loads(definition.decode('utf-8')), headers={"ETag": etag})
+
+            self.send_json({"error": "unknown endpoint"}, status=404)
+
+        def do_POST(self):
+            body = self.read_body()
+            if not self.before():
+                return
+            parsed = urlparse(self.path)
+            path = parsed.path
+
+            if path == "/api/login":
+                params = parse_qs(parsed.query)
+                return self.send_json({"token": hashlib.sha1(params.get("username", [""])[0].encode()).hexdigest()})
+
+            m = re.match(rf"^/api/task_assignment/({NAME})/({NAME})/new_assignment$", path)
+            if m:
+                count = int(parse_qs(parsed.query).get("assignmentCount", ["1"])[0])
+                state.add_assignments(*m.groups(), count=count)
+                return self.send_json({"ok": True})
+
+            m = re.match(rf"^/api/({'|'.join(RESOURCE_TYPES)})/({NAME})/({NAME})(?:/questions/({NAME}))?$", path)
+            if m:
+                resource_type, user, name, question_id = m.groups()
+                try:
+                    json.loads(body.decode('utf-8'))
+                except ValueError:
+                    return self.send_json({"error": "invalid definition"}, status=400)
+                with state.lock:
+                    key = (resource_type, user, name if question_id is None else f"{name}/{question_id}")
+                    state.resources[key] = body
+                return self.send_json({"ok": True})
+
+            self.send_json({"error": "unknown endpoint"}, status=404)
+
+    return Handler
+
+
+def serve(state, host="127.0.0.1", port=0):
+    """
+    Start the stand-in on a background thread.
+    return: (server, site_url); call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=10001, type=int)
+@click.option("--responses", default=1000, type=int, help="Number of responses of every exam.")
+@click.option("--tasks", default=100, type=int, help="Number of tasks of every taskset.")
+@click.option("--workers", default=None, type=int, help="Number of distinct workers answering exams.")
+@click.option("--latency", default=0.0, type=float, help="Seconds added to every request.")
+@click.option("--error-rate", default=0.0, type=float, help="Fraction of requests answered with a 502.")
+def main(host, port, responses, tasks, workers, latency, error_rate):
+    state = FakeCrowdAQ(responses=responses, tasks=tasks, workers=workers, latency=latency, error_rate=error_rate)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    print(f"Serving a fake CrowdAQ on http://{host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+In-process stand-in for the boto3 MTurk client used by mturk_utils.py and mturk_cli.py.
+
+    fake = FakeMTurk(rate=20, latency=0.01)
+    install(fake)  # mturk_cli.getClientFromProfile now returns fake
+
+Calls above `rate` per second (token bucket of `burst` calls) fail with a ThrottlingException ClientError, like the
+real service does, so call_with_backoff and the thread pools are exercised as against MTurk.
+"""
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+MAX_PAGE_SIZE = 100
+
+
+def client_error(code, message, operation, **fields):
+    """fields: modeled fields of the error, such as TurkErrorCode, which botocore puts next to Error"""
+    return ClientError(dict({'Error': {'Code': code, 'Message': message}}, **fields), operation)
+
+
+class FakeMTurk(object):
+    def __init__(self, rate=None, burst=None, latency=0.0, throttle_rate=0.0, seed=0):
+        self.rate = rate
+        self.burst = burst or (rate or 1)
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.hits = {}
+        self.hit_order = []
+        self.request_tokens = {}
+        self.assignments = {}
+        self.qualification_types = {}
+        self.qualifications = {}
+        self.balance = 10000.0
+        self.calls = {}
+        self.throttled = 0
+
+    def _call(self, operation):
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            throttle = self.throttle_rate and self.rng.random() < self.throttle_rate
+            if self.rate:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens < 1:
+                    throttle = True
+                else:
+                    self.tokens -= 1
+            if throttle:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            raise client_error('ThrottlingException', 'Rate exceeded', operation)
+
+    def _page(self, items, MaxResults=MAX_PAGE_SIZE, NextToken=None):
+        start = int(NextToken or 0)
+        end = start + min(MaxResults, MAX_PAGE_SIZE)
+        page = {'NumResults': len(items[start:end])}
+        if end < len(items):
+            page['NextToken'] = str(end)
+        return items[start:end], page
+
+    def stats(self):
+        with self.lock:
+            return {'calls': sum(self.calls.values()), 'throttled': self.throttled, 'by_operation': dict(self.calls)}
+
+    def get_account_balance(self):
+        self._call('GetAccountBalance')
+        return {'AvailableBalance': f"{self.balance:.2f}"}
+
+    def create_hit(self, Title, Description, Reward, LifetimeInSeconds, AssignmentDurationInSeconds,
+                   Question, Keywords='', MaxAssignments=1, AutoApprovalDelayInSeconds=0,
+                   QualificationRequirements=(), UniqueRequestToken=None, **kwargs):
+        self._call('CreateHIT')
+        hit_type = repr((Title, Description, Keywords, Reward, AssignmentDurationInSeconds,
+                         AutoApprovalDelayInSeconds, QualificationRequirements))
+        hit_type_id = hashlib.sha1(hit_type.encode('utf-8')).hexdigest()[:30].upper()
+        with self.lock:
+            if UniqueRequestToken in self.request_tokens:
+                raise client_error(
+                    'RequestError',
+                    f"The HIT with ID {self.request_tokens[UniqueRequestToken]} already exists with this "
+                    f"UniqueRequestToken.", 'CreateHIT', TurkErrorCode='AWS.MechanicalTurk.HitAlreadyExists')
+            hit_id = f"{len(self.hits):030d}"
+            now = datetime.now(timezone.utc)
+            hit = {
+                'HITId': hit_id,
+                'HITTypeId': hit_type_id,
+                'HITGroupId': hit_type_id,
+                'CreationTime': now,
+                'Title': Title,
+                'Description': Description,
+                'Question': Question,
+                'Keywords': Keywords,
+                'HITStatus': 'Assignable',
+                'MaxAssignments': MaxAssignments,
+                'Reward': Reward,
+                'AutoApprovalDelayInSeconds': AutoApprovalDelayInSeconds,
+                'Expiration': now + timedelta(seconds=LifetimeInSeconds),
+                'AssignmentDurationInSeconds': AssignmentDurationInSeconds,
+                'QualificationRequirements': list(QualificationRequirements),
+                'NumberOfAssignmentsPending': 0,
+                'NumberOfAssignmentsAvailable': MaxAssignments,
+                'NumberOfAssignmentsCompleted': 0,
+            }
+            if kwargs.get('RequesterAnnotation'):
+                hit['RequesterAnnotation'] = kwargs['RequesterAnnotation']
+            self.hits[hit_id] = hit
+            self.hit_order.append(hit_id)
+            if UniqueRequestToken:
+                self.request_tokens[UniqueRequestToken] = hit_id
+            self.balance -= float(Reward) * MaxAssignments * 1.2
+            return {'HIT': dict(hit)}
+
+    def get_hit(self, HITId):
+        self._call('GetHIT')
+        with self.lock:
+            if HITId not in self.hits:
+                raise client_error('RequestError', f"Hit {HITId} does not exist.", 'GetHIT')
+            return {'HIT': dict(self.hits[HITId])}
+
+    def list_hits(self, **kwargs):
+        self._call('ListHITs')
+        with self.lock:
+            # ListHITs documents no order; creation order is what the fake returns.
+            items = [dict(self.hits[hit_id]) for hit_id in self.hit_order]
+        items, page = self._page(items, **kwargs)
+        page['HITs'] = items
+        return page
+
+    def list_hits_for_qualification_type(self, QualificationTypeId, **kwargs):
+        self._call('ListHITsForQualificationType')
+        with self.lock:
+            items = [dict(self.hits[hit_id]) for hit_id in self.hit_order
+                     if any(q['QualificationTypeId'] == QualificationTypeId
+                            for q in self.hits[hit_id]['QualificationRequirements'])]
+        items, page = self._page(items, **kwargs)
+        page['HITs'] = items
+        return page
+
+    def update_expiration_for_hit(self, HITId, ExpireAt):
+        self._call('UpdateExpirationForHIT')
+        with self.lock:
+            if HITId not in self.hits:
+                raise client_error('RequestError', f"Hit {HITId} does not exist.", 'UpdateExpirationForHIT')
+            if isinstance(ExpireAt, (int, float)):
+                ExpireAt = datetime.fromtimestamp(ExpireAt, timezone.utc)
+            now = datetime.now(timezone.utc)
+            hit = self.hits[HITId]
+            if ExpireAt.tzinfo is None:
+                ExpireAt = ExpireAt.replace(tzinfo=timezone.utc)
+            hit['Expiration'] = max(ExpireAt, now)
+            if hit['Expiration'] <= now:
+                hit['HITStatus'] = 'Reviewable'
+        return {}
+
+    def reset_expiration(self, LifetimeInSeconds=3600):
+        """Make every HIT assignable again for LifetimeInSeconds, e.g. to expire the same HITs in several runs."""
+        with self.lock:
+            expiration = datetime.now(timezone.utc) + timedelta(seconds=LifetimeInSeconds)
+            for hit in self.hits.values():
+                hit['Expiration'] = expiration
+                hit['HITStatus'] = 'Assignable'
+
+    def add_assignments(self, hit_id, count, worker_ids=None):
+        """Simulate workers submitting `count` assignments of a HIT."""
+        with self.lock:
+            assignments = self.assignments.setdefault(hit_id, [])
+            for _ in range(count):
+                worker_id = worker_ids.pop() if worker_ids else f"W{self.rng.randrange(10 ** 6):06d}"
+                assignments.append({
+                    'AssignmentId': f"{hit_id[:20]}{len(assignments):010d}",
+                    'WorkerId': worker_id,
+                    'HITId': hit_id,
+                    'AssignmentStatus': 'Submitted',
+                    'SubmitTime': datetime.now(timezone.utc),
+                    'Answer': '<QuestionFormAnswers/>',
+                })
+            hit = self.hits[hit_id]
+            hit['NumberOfAssignmentsCompleted'] = len(assignments)
+            hit['NumberOfAssignmentsAvailable'] = max(0, hit['MaxAssignments'] - len(assignments))
+
+    def list_assignments_for_hit(self, HITId, AssignmentStatuses=None, **kwargs):
+        self._call('ListAssignmentsForHIT')
+        with self.lock:
+            items = [dict(a) for a in self.assignments.get(HITId, [])
+                     if not AssignmentStatuses or a['AssignmentStatus'] in AssignmentStatuses]
+        items, page = self._page(items, **kwargs)
+        page['Assignments'] = items
+        return page
+
+    def create_qualification_type(self, Name, Description, QualificationTypeStatus, **kwargs):
+        self._call('CreateQualificationType')
+        with self.lock:
+            qual_id = hashlib.sha1(Name.encode('utf-8')).hexdigest()[:30].upper()
+            if qual_id in self.qualification_types:
+                raise client_error('RequestError', f"You have already created a QualificationType with this name",
+                                   'CreateQualificationType')
+            self.qualification_types[qual_id] = {
+                'QualificationTypeId': qual_id,
+                'Name': Name,
+                'Description': Description,
+                'QualificationTypeStatus': QualificationTypeStatus,
+                'CreationTime': datetime.now(timezone.utc),
+            }
+            self.qualifications[qual_id] = {}
+            return {'QualificationType': dict(self.qualification_types[qual_id])}
+
+    def associate_qualification_with_worker(self, QualificationTypeId, WorkerId, IntegerValue=1,
+                                            SendNotification=False):
+        self._call('AssociateQualificationWithWorker')
+        with self.lock:
+            self.qualifications.setdefault(QualificationTypeId, {})[WorkerId] = IntegerValue
+        return {}
+
+    def disassociate_qualification_from_worker(self, WorkerId, QualificationTypeId, Reason=''):
+        self._call('DisassociateQualificationFromWorker')
+        with self.lock:
+            holders = self.qualifications.get(QualificationTypeId, {})
+            if WorkerId not in holders:
+                raise client_error('RequestError', f"Worker {WorkerId} does not hold {QualificationTypeId}",
+                                   'DisassociateQualificationFromWorker')
+            del holders[WorkerId]
+        return {}
+
+    def list_workers_with_qualification_type(self, QualificationTypeId, Status='Granted', **kwargs):
+        self._call('ListWorkersWithQualificationType')
+        with self.lock:
+            items = [
+                {'QualificationTypeId': QualificationTypeId, 'WorkerId': wid, 'IntegerValue': value,
+                 'Status': 'Granted'}
+                for wid, value in sorted(self.qualifications.get(QualificationTypeId, {}).items())
+            ]
+        items, page = self._page(items, **kwargs)
+        page['Qualifications'] = items
+        return page
+
+
+def install(fake):
+    """Make mturk_cli use `fake` for every profile and sandbox setting."""
+    import mturk_cli
+    mturk_cli.getClientFromProfile = lambda profile, sandbox=False: fake
+    return fake
@@ -4,13 +4,17 @@ import sys
 from os.path import expanduser
 
 import click
-import requests
 import os
 import getpass
 import logging
-from datetime import datetime
 
-from client import Client, resolve_resource, resolve_resource_with_name
+from client import Client, TaskSet, resolve_resource, resolve_resource_with_name, \
+    DEFAULT_RESPONSE_BATCH_SIZE, DEFAULT_RESPONSE_CONCURRENCY
+from metrics import RequestMetrics
+from project import open_definition, push_project
+from sync_index import SyncIndex
+from sync_store import iter_records, open_writer, OUTPUT_FORMATS, COMPRESSIONS, DEFAULT_SHARD_SIZE
+from taskset_builder import build_taskset, upload_shard, DEFAULT_MAX_TASKS, DEFAULT_MAX_BYTES
 
 
 def load_config(config_file):
@@ -30,6 +34,13 @@ def load_config(config_file):
         raise ValueError(f"{config_file} is not a file.")
 
 
+def make_client(ctx, conf):
+    metrics = ctx.obj['metrics']
+    if metrics is not None:
+        metrics.site_url = conf['site_url']
+    return Client(conf, use_cache=ctx.obj['use_cache'], metrics=metrics)
+
+
 def cache_token(token, config, config_file):
     config['token'] = token
     with open(config_file, "w") as of:
@@ -39,13 +50,30 @@ def cache_token(token, config, config_file):
 @click.group()
 @click.option("--config-file", '-c', default="~/.crowdaq/config.json")
 @click.option("--debug", is_flag=True)
+@click.option("--cache/--no-cache", default=None,
+              help="Cache resource reads on disk. Defaults to the cache.enabled setting of the config file.")
+@click.option("--metrics-out", default=None,
+              help="Write per-endpoint request counts, latencies, bytes and retries to this JSON file.")
+@click.option("--metrics-prom", default=None,
+              help="Write the same metrics in Prometheus text format, e.g. for the node_exporter textfile collector.")
 @click.pass_context
-def cli(ctx, config_file, debug):
+def cli(ctx, config_file, debug, cache, metrics_out, metrics_prom):
     if debug:
         logging.basicConfig(level=logging.DEBUG)
 
     ctx.ensure_object(dict)
     ctx.obj['config_filepath'] = expanduser(config_file)
+    ctx.obj['use_cache'] = cache
+    ctx.obj['metrics'] = None
+    if metrics_out or metrics_prom:
+        metrics = ctx.obj['metrics'] = RequestMetrics()
+
+        def write_metrics():
+            if metrics_out:
+                metrics.write_json(metrics_out)
+            if metrics_prom:
+                metrics.write_prometheus(metrics_prom)
+        ctx.call_on_close(write_metrics)
 
 
 @cli.command()
@@ -91,8 +119,10 @@ def config(ctx):
 def _login(ctx):
     conf = load_config(ctx.obj['config_filepath'])
 
+    client = make_client(ctx, conf)
+
     url = f"{conf['site_url']}/api/login"
-    resp = requests.post(url, params={
+    resp = client.post(url, params={
         "username": conf['user'],
         "password": conf['password'],
     })
@@ -110,8 +140,10 @@ def _login(ctx):
 def _get_token(ctx):
     conf = load_config(ctx.obj['config_filepath'])
 
+    client = make_client(ctx, conf)
+
     url = f"{conf['site_url']}/api/login"
-    resp = requests.post(url, params={
+    resp = client.post(url, params={
         "username": conf['user'],
         "password": conf['password'],
     })
@@ -128,30 +160,91 @@ def _get_token(ctx):
 @click.pass_context
 def _create(ctx, resource: str, file: str, overwrite):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
+    client = make_client(ctx, conf)
 
     resources, resource_type, resource_id = resolve_resource_with_name(resource, client)
-    resource_def = ""
-    with open(file) as file_input:
-        resource_def = file_input.read()
-
-    if resource_type == "instruction":
-        if file.endswith(".md"):
-            resource_def = json.dumps(
-                {
-                    "document": resource_def
-                }
-            )
-        elif file.endswith(".json"):
-            pass
-        else:
-            raise ValueError("Instruction definition file must ends with either md or json")
+    resource_def = open_definition(resource_type, file)
 
     # Should validate resource schema here.
-    if overwrite or resources.get(resource_id) is None:
-        resources.update(resource_id, resource_def)
-    else:
-        print("Resource already exists.")
+    try:
+        if overwrite or resources.get(resource_id) is None:
+            resources.update(resource_id, resource_def)
+        else:
+            print("Resource already exists.")
+    finally:
+        if hasattr(resource_def, 'close'):
+            resource_def.close()
+
+
+@cli.command("push")
+@click.argument('project_dir')
+@click.option('--compare', type=click.Choice(["state", "server"]), default="state",
+              help="Detect changes against the local push state file or against the copies on the server.")
+@click.option('--force', is_flag=True, help="Upload every resource of the project.")
+@click.option('--concurrency', default=8, type=int)
+@click.option('--dryrun', '-d', is_flag=True)
+@click.pass_context
+def _push(ctx, project_dir, compare, force, concurrency, dryrun):
+    conf = load_config(ctx.obj['config_filepath'])
+    client = make_client(ctx, conf)
+
+    uploaded, unchanged, failed = push_project(project_dir, client, conf['user'], compare=compare, force=force,
+                                               concurrency=concurrency, dryrun=dryrun)
+    if dryrun:
+        for name in uploaded:
+            print(f"Would push {name}")
+        print(f"{len(uploaded)} to push, {len(unchanged)} unchanged.")
+        return
+    print(f"{len(uploaded)} pushed, {len(unchanged)} unchanged, {len(failed)} failed.")
+    if failed:
+        sys.exit(1)
+
+
+@cli.command("build-taskset")
+@click.argument('documents')
+@click.argument('template')
+@click.argument('output_dir')
+@click.option('--name', required=True, help="Shards are named <name>_0000, <name>_0001, ...")
+@click.option('--max-tasks', default=DEFAULT_MAX_TASKS, type=int, help="Maximum number of tasks per shard.")
+@click.option('--max-bytes', default=DEFAULT_MAX_BYTES, type=int, help="Maximum size in bytes of a shard.")
+@click.option('--processes', default=1, type=int, help="Number of processes instantiating the template.")
+@click.option('--upload', is_flag=True, help="Create every shard as task/<user>/<shard> once it is written.")
+@click.option('--concurrency', default=4, type=int, help="Number of shards uploaded in parallel.")
+@click.pass_context
+def _build_taskset(ctx, documents, template, output_dir, name, max_tasks, max_bytes, processes, upload, concurrency):
+    """
+    Instantiate TEMPLATE, the JSON of one task with {{field}} placeholders, for every document of DOCUMENTS
+    (a JSON array or JSONL), and write the tasks into TaskSet definitions in OUTPUT_DIR.
+    """
+    if not upload:
+        count, shards = build_taskset(documents, template, output_dir, name, max_tasks=max_tasks,
+                                      max_bytes=max_bytes, processes=processes)
+        print(f"{count} tasks written to {len(shards)} shards in {output_dir}")
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    conf = load_config(ctx.obj['config_filepath'])
+    client = make_client(ctx, conf)
+    tasksets = TaskSet(conf['user'], client)
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        def on_shard(shard_name, path):
+            futures.append(executor.submit(upload_shard, tasksets, shard_name, path))
+
+        count, shards = build_taskset(documents, template, output_dir, name, max_tasks=max_tasks,
+                                      max_bytes=max_bytes, processes=processes, on_shard=on_shard)
+    print(f"{count} tasks written to {len(shards)} shards in {output_dir}")
+
+    failed = 0
+    for future in futures:
+        try:
+            print(f"Created task/{conf['user']}/{future.result()}")
+        except Exception as e:
+            print(f"Failed to upload a shard: {e}")
+            failed += 1
+    print(f"{len(futures) - failed} shards uploaded, {failed} failed.")
+    if failed:
+        sys.exit(1)
 
 
 @cli.command("get")
@@ -159,7 +252,7 @@ def _create(ctx, resource: str, file: str, overwrite):
 @click.pass_context
 def _get(ctx, resource):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
+    client = make_client(ctx, conf)
     print(f"Found the following resource under {resource}")
     resources, resource_type, resource_id = resolve_resource_with_name(resource, client)
     print(resources.get(resource_id))
@@ -170,7 +263,7 @@ def _get(ctx, resource):
 @click.pass_context
 def _list(ctx, resource):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
+    client = make_client(ctx, conf)
     print(f"Found the following resource under {resource}")
     resource, resource_type = resolve_resource(resource, client)
     for item in resource.list():
@@ -183,7 +276,7 @@ def _list(ctx, resource):
 @click.pass_context
 def _set(ctx, resource, modifiers):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
+    client = make_client(ctx, conf)
     print(f"Found the following resource under {resource}")
     resources, resource_type, resource_id = resolve_resource_with_name(resource, client)
 
@@ -202,10 +295,23 @@ def _set(ctx, resource, modifiers):
 @cli.command("sync-response")
 @click.argument('resource')
 @click.argument('output_folder')
+@click.option('--batch-size', default=DEFAULT_RESPONSE_BATCH_SIZE, type=int,
+              help="Maximum number of responses fetched per request.")
+@click.option('--concurrency', default=DEFAULT_RESPONSE_CONCURRENCY, type=int,
+              help="Number of batches fetched in parallel.")
+@click.option('--rebuild-index', is_flag=True,
+              help="Rescan every sync file instead of trusting the sync index.")
+@click.option('--format', 'output_format', type=click.Choice(OUTPUT_FORMATS), default="json",
+              help="json writes one pretty-printed array per sync, jsonl appends one record per line to shards.")
+@click.option('--compress', type=click.Choice(list(COMPRESSIONS)), default="none",
+              help="Compression of jsonl shards.")
+@click.option('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+              help="Size in bytes after which a new jsonl shard is started.")
 @click.pass_context
-def _sync_response(ctx, resource, output_folder):
+def _sync_response(ctx, resource, output_folder, batch_size, concurrency, rebuild_index,
+                   output_format, compress, shard_size):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
+    client = make_client(ctx, conf)
     print(f"Found the following resource under {resource}")
     resources, resource_type, resource_id = resolve_resource_with_name(resource, client)
 
@@ -213,39 +319,42 @@ def _sync_response(ctx, resource, output_folder):
         print(f"Sync response is not available for the resource type: {resource_type}")
         sys.exit(1)
 
+    if output_format == "json" and compress != "none":
+        print("--compress is only available with --format jsonl")
+        sys.exit(1)
 
-    loaded_pids = set()
 
-    print("Loading existing files now.")
-    for f in os.listdir(output_folder):
-        if f.startswith("crowdaq_assignment_sync_") and f.endswith(".json"):
-            fullpath = os.path.join(output_folder, f)
-            with open(fullpath) as input_fd:
-                try:
-                    records = json.load(input_fd)
-                except json.decoder.JSONDecodeError as e:
-                    print(f"File {f} cannot be loaded.")
-                    continue
-                for r in records:
-                    loaded_pids.add(r['pid'])
+    print("Loading sync index now.")
+    index = SyncIndex.load(output_folder)
+    if rebuild_index:
+        index.rebuild()
+        index.save()
+    elif index.refresh():
+        index.save()
+    loaded_pids = index.pids()
 
     print(f"Found {len(loaded_pids)} records downloaded.")
     response_ids = resources.list_responses(resource_id)
-    print(f"Server has total {len(response_ids)} responses.")
+    print(f"Server has total {len(response_ids['results'])} responses.")
 
-    pids_to_load = {x for x in response_ids['results']}.difference(loaded_pids)
+    pids_to_load = [x for x in response_ids['results'] if x not in loaded_pids]
     print(f"{len(pids_to_load)} records will be downloaded now.")
     if len(pids_to_load) == 0:
         return
 
-    all_responses = resources.get_responses(resource_id, pids_to_load)
-    now = datetime.now()
-    dt_string = now.strftime("%Y-%m-%d-%H-%M-%S")
-    output_filename = os.path.join(output_folder, f"crowdaq_assignment_sync_{dt_string}.json")
-    with open(output_filename, "w") as output_fd:
-        json.dump(all_responses['results'], output_fd, indent=2)
+    writer = open_writer(output_format, output_folder, index, compression=compress, shard_size=shard_size)
+    written = 0
+    with click.progressbar(length=len(pids_to_load), label="Downloading responses") as progress:
+        for records in resources.iter_responses(resource_id, pids_to_load,
+                                                batch_size=batch_size, concurrency=concurrency):
+            for record in records:
+                writer.write(record)
+            written += len(records)
+            progress.update(len(records))
+    output_files = writer.close()
+    index.save()
 
-    print("Finished.")
+    print(f"Finished. {written} records written to {', '.join(output_files)}")
 
 
 @cli.command("get-report")
@@ -253,7 +362,7 @@ def _sync_response(ctx, resource, output_folder):
 @click.pass_context
 def _get_report(ctx, resource):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
+    client = make_client(ctx, conf)
     print(f"Found the following resource under {resource}")
     resources, resource_type, resource_id = resolve_resource_with_name(resource, client)
 
@@ -265,19 +374,69 @@ def _get_report(ctx, resource):
     print(report)
 
 
+@cli.command("analyze")
+@click.argument('response_folder')
+@click.argument('output')
+@click.option('--format', 'output_format', type=click.Choice(["json", "csv"]), default="json",
+              help="json writes OUTPUT as one file, csv writes workers.csv, questions.csv and summary.json into it.")
+@click.option('--question-set', default=None,
+              help="Question set file or resource (question_set/<user>/<name>) whose answer fields are the gold "
+                   "answers. Questions without one are scored against their majority answer.")
+@click.option('--min-answers', default=1, type=click.IntRange(min=1), help="Answers a worker needs to be graded.")
+@click.option('--field', 'fields', multiple=True, metavar="KEY=NAME",
+              help="Name of a response field when it differs from the default, e.g. --field worker=workerId. "
+                   "Keys: worker, answers, question, answer, time_spent, started, finished.")
+@click.pass_context
+def _analyze(ctx, response_folder, output, output_format, question_set, min_answers, fields):
+    """
+    Per-worker accuracy, per-question difficulty, agreement and time on task of the responses synced into
+    RESPONSE_FOLDER by sync-response. The grades of the json output can be passed to mturk_cli.py assign-qual.
+    """
+    from analytics import AnswerTable, analyze, gold_answers, write_csv, write_json
+
+    gold = None
+    if question_set and os.path.isfile(question_set):
+        with open(question_set) as question_set_input:
+            gold = gold_answers(json.load(question_set_input))
+    elif question_set:
+        conf = load_config(ctx.obj['config_filepath'])
+        client = make_client(ctx, conf)
+        resources, resource_type, resource_id = resolve_resource_with_name(question_set, client)
+        if resource_type != "question_set":
+            print(f"{question_set} is neither a file nor a question set resource")
+            sys.exit(1)
+        definition = resources.get(resource_id)
+        if definition is None:
+            print(f"Cannot find {question_set}")
+            sys.exit(1)
+        gold = gold_answers(definition)
+
+    if any("=" not in field for field in fields):
+        print("--field takes KEY=NAME")
+        sys.exit(1)
+    table = AnswerTable(iter_records(response_folder), fields=dict(field.split("=", 1) for field in fields))
+    result = analyze(table, gold=gold, min_answers=min_answers)
+    output_files = write_csv(result, output) if output_format == "csv" else write_json(result, output)
+    summary = result['summary']
+    print(f"{summary['answers']} answers of {summary['workers']} workers to {summary['questions']} questions "
+          f"({summary['gold_questions']} with gold answers), accuracy {summary['accuracy']}, "
+          f"Fleiss' kappa {summary['fleiss_kappa']}.")
+    print(f"Written to {', '.join(output_files)}")
+
+
 @cli.command("post")
 @click.argument('url')
 @click.option('--body', "-b")
 @click.pass_context
 def post(ctx, url, body):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
+    client = make_client(ctx, conf)
 
     if body is not None:
         with open(body) as input_fd:
-            resp = requests.post(url, input_fd.read(), headers=client.auth_headers)
+            resp = client.post(url, input_fd.read(), headers=client.auth_headers, retry=False)
     else:
-        resp = requests.post(url, headers=client.auth_headers)
+        resp = client.post(url, headers=client.auth_headers, retry=False)
     print(resp.status_code)
     print(resp.content.decode('utf-8'))
 
@@ -287,8 +446,8 @@ def post(ctx, url, body):
 @click.pass_context
 def get(ctx, url):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
-    resp = requests.get(url, headers=client.auth_headers)
+    client = make_client(ctx, conf)
+    resp = client.get(url, headers=client.auth_headers)
     print(resp.status_code, file=sys.stderr)
     print(resp.content.decode('utf-8'))
 
@@ -298,16 +457,10 @@ def get(ctx, url):
 @click.pass_context
 def gen_task_unfinished_urls(ctx, taskname, targetcnt):
     conf = load_config(ctx.obj['config_filepath'])
-    client = Client(conf)
-    url = f"{conf['site_url']}/api/task_report/{conf['user']}/{taskname}"
-    resp = requests.get(url, headers=client.auth_headers)
-    print(resp.status_code, file=sys.stderr)
-    progress = json.loads(resp.content.decode('utf-8'))
-    for p in progress['assignment_count']:
-        taskid = p['task_id']
-        count = p['count']
-        for _ in range(count,targetcnt):
-            print(f"{conf['site_url']}/w/task/{conf['user']}/{taskname}/{taskid}")
+    client = make_client(ctx, conf)
+    for url, missing in TaskSet(conf['user'], client).iter_unfinished_urls(taskname, targetcnt):
+        for _ in range(missing):
+            print(url)
 
 
 if __name__ == '__main__':
@@ -1,17 +1,342 @@
+import gzip
+import os
 import re
-import requests
+import zlib
+import time
+import random
 import json
 import logging
+from itertools import islice
+
+# requests, sqlite3 (response_cache) and concurrent.futures are imported where they are used, so that commands
+# which never touch the network start fast.
+
+
+DEFAULT_HTTP_CONFIG = {
+    "pool_connections": 10,
+    "pool_maxsize": 32,
+    "connect_timeout": 10,
+    "read_timeout": 120,
+    "max_retries": 5,
+    "backoff_factor": 0.5,
+    "backoff_max": 30,
+    # Request bodies of at least compress_min_bytes are sent gzip-compressed. Off by default, as the server has to
+    # accept Content-Encoding: gzip.
+    "compress_uploads": False,
+    "compress_min_bytes": 16 * 1024,
+    "compress_level": 6,
+    # "auto" advertises every encoding urllib3 can decode: gzip and deflate, plus br and zstd when the brotli or
+    # zstandard package is installed. "identity" asks for uncompressed responses, so that none has to be decompressed.
+    "accept_encoding": "auto",
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+DEFAULT_RESPONSE_BATCH_SIZE = 200
+DEFAULT_RESPONSE_CONCURRENCY = 4
+# Keep the joined id path segment well under common proxy/server URL limits.
+MAX_RESPONSE_PATH_LENGTH = 4000
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def is_stream(data):
+    """
+    return: whether a request body is a file-like object or an iterable of chunks rather than an in-memory value
+    """
+    return hasattr(data, 'read') or \
+        (hasattr(data, '__iter__') and not isinstance(data, (bytes, str, dict, list, tuple)))
+
+
+def iter_chunks(data, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    return: yields the content of a file-like object (text or binary) or of an iterable of str/bytes as bytes
+    """
+    if hasattr(data, 'read'):
+        chunks = iter(lambda: data.read(chunk_size), None)
+    else:
+        chunks = iter(data)
+    for chunk in chunks:
+        if not chunk:
+            if hasattr(data, 'read'):
+                return
+            continue
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def stream_size(body, offset=None):
+    """
+    return: number of bytes left to read in a file body, or None when it cannot be known without reading it
+    """
+    try:
+        size = os.fstat(body.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return None
+    return size - (offset or 0)
+
+
+def wire_bytes(resp):
+    """
+    return: number of bytes of the response body read from the connection, i.e. before it was decompressed
+    """
+    try:
+        return resp.raw.tell()
+    except AttributeError:
+        return len(resp.content or b'')
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accept_encoding(setting):
+    """
+    return: the Accept-Encoding header for the accept_encoding setting
+    """
+    if setting == "auto":
+        from urllib3.util.request import ACCEPT_ENCODING
+        return ACCEPT_ENCODING
+    return setting
 
 
 class Client(object):
-    def __init__(self, config):
+    def __init__(self, config, use_cache=None, metrics=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
         self.site_url = config['site_url']
-        self.token = config['token']
+        self.metrics = metrics
+        self.user = config.get('user', '')
+        self.token = config.get('token', '')
         self.auth_headers = {
             "Authorizations": f"Bearer {self.token}"
         }
 
+        http_config = dict(DEFAULT_HTTP_CONFIG)
+        http_config.update(config.get('http', {}))
+        self.http_config = http_config
+        self.timeout = (http_config['connect_timeout'], http_config['read_timeout'])
+
+        # One keep-alive session shared by every resource built on this client.
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = accept_encoding(http_config['accept_encoding'])
+        adapter = HTTPAdapter(pool_connections=http_config['pool_connections'],
+                              pool_maxsize=http_config['pool_maxsize'])
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        if use_cache is None:
+            # Caching is off unless enabled, as in DEFAULT_CACHE_CONFIG; checked here so that response_cache, and
+            # with it sqlite3, is only imported when the cache is used.
+            use_cache = config.get('cache', {}).get('enabled', False)
+        self.cache = None
+        if use_cache:
+            from response_cache import ResponseCache, DEFAULT_CACHE_CONFIG
+            cache_config = dict(DEFAULT_CACHE_CONFIG)
+            cache_config.update(config.get('cache', {}))
+            self.cache = ResponseCache(cache_config['path'], ttl=cache_config['ttl'],
+                                       max_bytes=cache_config['max_bytes'])
+
+    def backoff_delay(self, attempt, resp=None):
+        """
+        Exponential backoff with full jitter, honouring Retry-After when the server sends one.
+        """
+        if resp is not None and resp.headers.get('Retry-After', '').isdigit():
+            return min(float(resp.headers['Retry-After']), self.http_config['backoff_max'])
+        delay = min(self.http_config['backoff_factor'] * (2 ** attempt), self.http_config['backoff_max'])
+        return random.uniform(0, delay)
+
+    def request(self, method, url, retry=True, **kwargs):
+        """
+        data may also be a callable returning a fresh iterable of bytes chunks for every attempt,
+        which is then sent with chunked transfer encoding.
+        """
+        import requests
+        kwargs.setdefault('timeout', self.timeout)
+        max_retries = self.http_config['max_retries'] if retry else 0
+        make_body = kwargs.pop('data') if callable(kwargs.get('data')) else None
+        sent = [0]
+
+        def counted(chunks):
+            for chunk in chunks:
+                sent[0] += len(chunk)
+                yield chunk
+
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            if make_body is not None:
+                sent[0] = 0
+                kwargs['data'] = counted(make_body())
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= max_retries:
+                    self.record(method, url, type(e).__name__, start, attempt, kwargs, sent=sent[0])
+                    raise
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"{method} {url} failed with {e!r}, retrying in {delay:.2f}s")
+            else:
+                if resp.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                    if kwargs.get('stream'):
+                        self.record_on_close(method, url, resp.status_code, start, attempt, kwargs, resp,
+                                             sent=sent[0])
+                    else:
+                        self.record(method, url, resp.status_code, start, attempt, kwargs, resp, sent=sent[0])
+                    return resp
+                # Hand the connection back to the pool, also when the body was requested with stream=True.
+                resp.close()
+                delay = self.backoff_delay(attempt, resp)
+                logging.warning(f"{method} {url} returned {resp.status_code}, retrying in {delay:.2f}s")
+            attempt += 1
+            time.sleep(delay)
+
+    def record(self, method, url, status, start, retries, kwargs, resp=None, sent=0):
+        if self.metrics is None:
+            return
+        data = kwargs.get('data')
+        request_bytes = len(data) if isinstance(data, (bytes, str)) else sent
+        self.metrics.record(method, url, status, time.perf_counter() - start, request_bytes=request_bytes,
+                            response_wire_bytes=wire_bytes(resp) if resp is not None else 0, retries=retries)
+
+    def record_on_close(self, method, url, status, start, retries, kwargs, resp, sent=0):
+        """
+        The body of a streamed response is only read by the caller, so the response is recorded once it is closed.
+        """
+        if self.metrics is None:
+            return
+        close = resp.close
+
+        def close_and_record():
+            resp.close = close
+            close()
+            self.record(method, url, status, start, retries, kwargs, resp, sent=sent)
+        resp.close = close_and_record
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        if is_stream(data):
+            return self.post_stream(url, data, **kwargs)
+        if isinstance(data, bytes) and self.http_config['compress_uploads'] \
+                and len(data) >= self.http_config['compress_min_bytes']:
+            data = gzip.compress(data, compresslevel=self.http_config['compress_level'])
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Content-Encoding': 'gzip'})
+        return self.request("POST", url, data=data, **kwargs)
+
+    def post_stream(self, url, body, **kwargs):
+        """
+        POST a file-like object or an iterable of str/bytes chunks without reading it into memory.
+        Seekable files and re-iterable bodies are sent again when the request is retried; one-shot iterators
+        such as generators cannot be replayed, so their requests are not retried.
+        """
+        if hasattr(body, 'read'):
+            replayable = hasattr(body, 'seekable') and body.seekable()
+            offset = body.tell() if replayable else None
+        else:
+            replayable = iter(body) is not body
+            offset = None
+        if not replayable:
+            kwargs['retry'] = False
+
+        compress = self.http_config['compress_uploads']
+        size = stream_size(body, offset)
+        # Bodies of unknown size, such as iterables of chunks, are compressed whatever compress_min_bytes is.
+        if compress and size is not None and size < self.http_config['compress_min_bytes']:
+            compress = False
+        if compress:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Content-Encoding': 'gzip'})
+
+        def make_body():
+            if offset is not None:
+                body.seek(offset)
+            chunks = iter_chunks(body)
+            return gzip_chunks(chunks, self.http_config['compress_level']) if compress else chunks
+        return self.request("POST", url, data=make_body, **kwargs)
+
+    def cached_get(self, url, **kwargs):
+        """
+        GET through the response cache when it is enabled. Only 200 responses are cached.
+        """
+        if self.cache is None:
+            return self.get(url, **kwargs)
+        from response_cache import cached_response
+
+        entry = self.cache.lookup(self.user, url)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            body, etag, last_modified, fresh = entry
+            if fresh:
+                logging.debug(f"Cache hit {url}")
+                return cached_response(url, body)
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        resp = self.get(url, headers=headers, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            logging.debug(f"Cache revalidated {url}")
+            self.cache.touch(self.user, url)
+            return cached_response(url, entry[0])
+        if resp.status_code == 200:
+            self.cache.store(self.user, url, resp.content,
+                             etag=resp.headers.get('ETag'), last_modified=resp.headers.get('Last-Modified'))
+        return resp
+
+    def invalidate(self, *urls):
+        if self.cache is None:
+            return
+        for url in urls:
+            self.cache.invalidate(self.user, url)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def parse_response(resp):
+    if resp.status_code == 200:
+        return json.loads(resp.content.decode('utf-8'))
+    elif resp.status_code == 404:
+        return None
+    else:
+        raise ValueError(resp.status_code, resp.content.decode('utf-8'))
+
+
+def parse_streamed_response(resp):
+    """
+    parse_response for a response requested with stream=True: the body is decompressed as the JSON parser reads it
+    from the socket, instead of first being buffered compressed and then decompressed and decoded in full.
+    """
+    with resp:
+        if resp.status_code == 200:
+            resp.raw.decode_content = True
+            return json.load(resp.raw)
+        return parse_response(resp)
+
+
+def split_response_ids(response_ids, batch_size=DEFAULT_RESPONSE_BATCH_SIZE,
+                       max_length=MAX_RESPONSE_PATH_LENGTH):
+    batch = []
+    length = 0
+    for response_id in response_ids:
+        response_id = str(response_id)
+        if batch and (len(batch) >= batch_size or length + len(response_id) + 1 > max_length):
+            yield batch
+            batch = []
+            length = 0
+        batch.append(response_id)
+        length += len(response_id) + 1
+    if batch:
+        yield batch
+
 
 class ListingRequestModifier(object):
     def __init__(self, page, item_per_page, ):
@@ -34,40 +359,33 @@ class ResourceBase(object):
         raise NotImplementedError()
 
     def get(self, name):
-        resp = requests.get(self.get_url(name))
+        resp = self.client.cached_get(self.get_url(name))
         logging.debug(f"Fetching {self.get_url(name)}")
         if resp.status_code == 200:
             logging.info(f"Found {self.get_url(name)}")
-            return json.loads(resp.content.decode('utf-8'))
         elif resp.status_code == 404:
             logging.warning(f"{self.get_url(name)} return 404")
-            return None
-        else:
-            raise ValueError(resp.status_code, resp.content.decode('utf-8'))
+        return parse_response(resp)
 
     def update(self, name, definition):
+        """
+        definition: str, bytes, or a file-like object or iterable of chunks, which is streamed to the server
+        """
         logging.debug(f"Updating {self.get_url(name)}")
-        resp = requests.post(self.get_url(name),
-                             data=definition.encode('utf-8'),
-                             headers=self.client.auth_headers)
+        resp = self.client.post(self.get_url(name),
+                                data=definition.encode('utf-8') if isinstance(definition, str) else definition,
+                                headers=self.client.auth_headers)
+        self.client.invalidate(self.get_url(name), self.get_category_url())
         if resp.status_code == 200:
             logging.info(f"Updated {self.get_url(name)}")
-            return json.loads(resp.content.decode('utf-8'))
         elif resp.status_code == 404:
             logging.warning(f"Cannot find {self.get_url(name)}")
-            return None
-        else:
-            raise ValueError(resp.status_code, resp.content.decode('utf-8'))
+        return parse_response(resp)
 
     def list(self):
-        resp = requests.get(self.get_category_url(),
-                            headers=self.client.auth_headers)
-        if resp.status_code == 200:
-            return json.loads(resp.content.decode('utf-8'))
-        elif resp.status_code == 404:
-            return None
-        else:
-            raise ValueError(resp.status_code, resp.content.decode('utf-8'))
+        resp = self.client.cached_get(self.get_category_url(),
+                                      headers=self.client.auth_headers)
+        return parse_response(resp)
 
 
 class Instruction(ResourceBase):
@@ -108,37 +426,54 @@ class Exam(ResourceBase):
 
     def list_responses(self, name):
         response_url = f"{self.client.site_url}/api/exam/{self.user}/{name}/response"
-        resp = requests.get(response_url,
-                            headers=self.client.auth_headers)
-        if resp.status_code == 200:
-            return json.loads(resp.content.decode('utf-8'))
-        elif resp.status_code == 404:
-            return None
-        else:
-            raise ValueError(resp.status_code, resp.content.decode('utf-8'))
+        resp = self.client.get(response_url,
+                               headers=self.client.auth_headers, stream=True)
+        return parse_streamed_response(resp)
 
-    def get_responses(self, exam_id, response_ids):
+    def get_response_batch(self, exam_id, response_ids):
         response_ids = "-".join([str(x) for x in response_ids])
         response_url = f"{self.client.site_url}/api/exam/{self.user}/{exam_id}/response/{response_ids}"
-        resp = requests.get(response_url,
-                            headers=self.client.auth_headers)
-        if resp.status_code == 200:
-            return json.loads(resp.content.decode('utf-8'))
-        elif resp.status_code == 404:
-            return None
-        else:
-            raise ValueError(resp.status_code, resp.content.decode('utf-8'))
+        resp = self.client.get(response_url,
+                               headers=self.client.auth_headers, stream=True)
+        return parse_streamed_response(resp)
+
+    def iter_responses(self, exam_id, response_ids, batch_size=DEFAULT_RESPONSE_BATCH_SIZE,
+                       concurrency=DEFAULT_RESPONSE_CONCURRENCY):
+        """
+        Fetch responses in batches of at most batch_size ids (and MAX_RESPONSE_PATH_LENGTH characters),
+        with up to concurrency batches in flight.
+        return: yields the list of records of each batch as soon as it arrives
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        batches = iter(split_response_ids(response_ids, batch_size))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            for batch in islice(batches, concurrency):
+                pending.add(executor.submit(self.get_response_batch, exam_id, batch))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for batch in islice(batches, 1):
+                        pending.add(executor.submit(self.get_response_batch, exam_id, batch))
+                    result = future.result()
+                    if result is None:
+                        logging.warning(f"A batch of responses of {exam_id} return 404")
+                        continue
+                    yield result['results']
+
+    def get_responses(self, exam_id, response_ids, batch_size=DEFAULT_RESPONSE_BATCH_SIZE,
+                      concurrency=DEFAULT_RESPONSE_CONCURRENCY):
+        results = []
+        for records in self.iter_responses(exam_id, response_ids, batch_size, concurrency):
+            results += records
+        return {"results": results}
 
     def get_report(self, name):
         report_url = f"{self.client.site_url}/api/exam/{self.user}/{name}/report"
-        resp = requests.get(report_url,
-                            headers=self.client.auth_headers)
-        if resp.status_code == 200:
-            return json.loads(resp.content.decode('utf-8'))
-        elif resp.status_code == 404:
-            return None
-        else:
-            raise ValueError(resp.status_code, resp.content.decode('utf-8'))
+        resp = self.client.get(report_url,
+                               headers=self.client.auth_headers, stream=True)
+        return parse_streamed_response(resp)
 
 
 class Question(ResourceBase):
@@ -163,75 +498,142 @@ class TaskSet(ResourceBase):
     def get_category_url(self):
         return f"{self.client.site_url}/api/task/{self.user}"
 
+    def get_report(self, name):
+        """
+        return: {"assignment_count": [{"task_id": ..., "count": ...}, ...]}
+        """
+        report_url = f"{self.client.site_url}/api/task_report/{self.user}/{name}"
+        resp = self.client.get(report_url,
+                               headers=self.client.auth_headers, stream=True)
+        return parse_streamed_response(resp)
+
+    def poll_report(self, name, validators=None):
+        """
+        Conditional GET of the task report.
+        validators: the validators returned by the previous poll
+        return: (report, validators), report being None when it did not change since then
+        """
+        headers = dict(self.client.auth_headers)
+        validators = validators or {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        report_url = f"{self.client.site_url}/api/task_report/{self.user}/{name}"
+        resp = self.client.get(report_url, headers=headers, stream=True)
+        if resp.status_code == 304:
+            resp.close()
+            return None, validators
+        validators = {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified')}
+        return parse_streamed_response(resp), validators
+
+    def get_task_url(self, name, task_id):
+        return f"{self.client.site_url}/w/task/{self.user}/{name}/{task_id}"
+
+    def iter_unfinished_urls(self, name, target_count, report=None):
+        """
+        report: the task report of name, fetched when not given
+        return: yields (task url, number of assignments missing to reach target_count) for every unfinished task
+        """
+        if report is None:
+            report = self.get_report(name)
+        for task in report['assignment_count']:
+            if task['count'] < target_count:
+                yield self.get_task_url(name, task['task_id']), target_count - task['count']
+
+
+NAME_PATTERN = "[a-zA-Z0-9_][a-zA-Z0-9-_]*"
+
+
+class ResourceRouter(object):
+    """
+    Registry of resource types, resolving identifiers such as exam/<user>/<exam_id> to resource objects.
+
+    Routes are compiled once when registered and grouped by their first path segment, so resolving an identifier
+    runs only the patterns of its own resource type. Routes of the same group are tried in registration order.
+    """
+
+    def __init__(self):
+        self.routes = {}
+
+    def register(self, resource_type, pattern, factory, category=False):
+        """
+        pattern: path with {param} placeholders, e.g. question_set/{user}/{question_set_id}/{name}.
+        factory(client=..., **params) builds the resource; {name} is the resource id and not passed to it.
+        category: the route names a listing rather than a single resource.
+        """
+        segments = pattern.split("/")
+        regex = "/".join(f"(?P<{s[1:-1]}>{NAME_PATTERN})" if s.startswith("{") else re.escape(s) for s in segments)
+        self.routes.setdefault((category, segments[0]), []).append(
+            (re.compile(f"^{regex}$"), resource_type, factory))
+
+    def match(self, url, category=False):
+        """
+        return: resource_type, factory, params of the first route matching url
+        """
+        url = url.lstrip("/")
+        for regex, resource_type, factory in self.routes.get((category, url.split("/", 1)[0]), ()):
+            match = regex.match(url)
+            if match:
+                return resource_type, factory, match.groupdict()
+        raise ValueError(f"Cannot parse Resource identifier /{url}")
+
+    def resolve(self, url, client, category=False, instances=None):
+        """
+        instances: optional dict reused across calls, so identifiers of the same user and type share one resource
+        return: resource, resource_type, resource id (None for a category)
+        """
+        resource_type, factory, params = self.match(url, category)
+        name = params.pop('name', None)
+        key = (factory, tuple(sorted(params.items())))
+        resource = instances.get(key) if instances is not None else None
+        if resource is None:
+            resource = factory(client=client, **params)
+            if instances is not None:
+                instances[key] = resource
+        return resource, resource_type, name
+
+    def resolve_many(self, urls, client, category=False):
+        """
+        return: list of (resource, resource_type, resource id) in the order of urls
+        """
+        instances = {}
+        return [self.resolve(url, client, category, instances) for url in urls]
+
+
+ROUTER = ResourceRouter()
+ROUTER.register("instruction", "instruction/{user}/{name}", Instruction)
+ROUTER.register("tutorial", "tutorial/{user}/{name}", Tutorial)
+ROUTER.register("question_set", "question_set/{user}/{name}", QuestionSet)
+ROUTER.register("question", "question_set/{user}/{question_set_id}/{name}", Question)
+ROUTER.register("exam", "exam/{user}/{name}", Exam)
+ROUTER.register("taskset", "task/{user}/{name}", TaskSet)
+ROUTER.register("instruction", "instruction/{user}", Instruction, category=True)
+ROUTER.register("tutorial", "tutorial/{user}", Tutorial, category=True)
+ROUTER.register("question_set", "question_set/{user}", QuestionSet, category=True)
+ROUTER.register("question", "question_set/{user}/{question_set_id}/questions", Question, category=True)
+ROUTER.register("exam", "exam/{user}", Exam, category=True)
+ROUTER.register("taskset", "task/{user}", TaskSet, category=True)
+
 
 def resolve_resource_with_name(url: str, client):
     """
     return: return url, resource_type, resource
     """
-    if not url.startswith("/"):
-        url = "/" + url
-
-    name_pattern = "[a-zA-Z0-9_][a-zA-Z0-9-_]*"
-    patterns = {
-        "instruction": rf"^/instruction/(?P<user>{name_pattern})/(?P<name>{name_pattern})$",
-        "tutorial": rf"^/tutorial/(?P<user>{name_pattern})/(?P<name>{name_pattern})$",
-        "question_set": rf"^/question_set/(?P<user>{name_pattern})/(?P<name>{name_pattern})$",
-        "question": rf"^/question_set/(?P<user>{name_pattern})/(?P<question_set_id>{name_pattern})/(?P<question_id>{name_pattern})$",
-        "exam": rf"^/exam/(?P<user>{name_pattern})/(?P<exam_id>{name_pattern})$",
-        "taskset": rf"^/task/(?P<user>{name_pattern})/(?P<taskset_id>{name_pattern})$",
-    }
-
-    for resource_type, pattern in patterns.items():
-        match = re.match(pattern, url)
-        if match:
-            if resource_type == "instruction":
-                return Instruction(match.group('user'), client), resource_type, match.group('name')
-            if resource_type == "tutorial":
-                return Tutorial(match.group('user'), client), resource_type, match.group('name')
-            if resource_type == "question_set":
-                return QuestionSet(match.group('user'), client), resource_type, match.group('name')
-            if resource_type == "question":
-                return QuestionSet(match.group('user'), client), resource_type, match.group('name')
-            if resource_type == "exam":
-                return Exam(
-                    user=match.group('user'),
-                    client=client), resource_type, match.group('exam_id')
-            if resource_type == "taskset":
-                return TaskSet(
-                    user=match.group('user'),
-                    client=client), resource_type, match.group('taskset_id')
-    raise ValueError(f"Cannot parse Resource identifier {url}")
+    return ROUTER.resolve(url, client)
 
 
 def resolve_resource(url: str, client):
     """
     return: return url, resource_type
     """
-    if not url.startswith("/"):
-        url = "/" + url
-
-    name_pattern = "[a-zA-Z0-9_][a-zA-Z0-9-_]*"
-
-    patterns = {
-        "instruction": rf"^/instruction/(?P<user>{name_pattern})$",
-        "tutorial": rf"^/tutorial/(?P<user>{name_pattern})$",
-        "question_set": rf"^/question_set/(?P<user>{name_pattern})$",
-        "question": rf"^/question_set/(?P<user>{name_pattern})/questions$",
-        "exam": rf"^/exam/(?P<user>{name_pattern})$",
-    }
-
-    for resource_type, pattern in patterns.items():
-        match = re.match(pattern, url)
-        if match:
-            if resource_type == "instruction":
-                return Instruction(match.group('user'), client), resource_type
-            if resource_type == "tutorial":
-                return Tutorial(match.group('user'), client), resource_type
-            if resource_type == "exam":
-                return Exam(match.group('user'), client), resource_type
-            if resource_type == "exam":
-                return Exam(
-                    user=match.group('user'),
-                    exam_id=match.group('exam_id'),
-                    client=client), resource_type
-    raise ValueError(f"Cannot parse Resource identifier {url}")
+    resource, resource_type, _ = ROUTER.resolve(url, client, category=True)
+    return resource, resource_type
+
+
+def resolve_many(urls, client):
+    """
+    Resolve many resource identifiers at once, sharing one resource object per user and type.
+    return: list of (resource, resource_type, resource id)
+    """
+    return ROUTER.resolve_many(urls, client)
@@ -25,34 +25,8 @@ then
 fi
 
 
-function list_task_repo_url_prefix {
-  cat $CROWDAQ_FILE | jq -r '.site_url + "/api/task_report/" + .user  '
-}
-
-
-function task_url {
-	echo $1
-	cat $CROWDAQ_FILE | jq -r '.site_url + "/w/task/" + .user  ' | xargs -I {} echo {}/$TASK_NAME/$1
-}
-
-
-#
-if [ -f /tmp/CROWDAQ_TASK_LIST_$TASK_NAME.txt ]; then
-	echo "/tmp/CROWDAQ_TASK_LIST_$TASK_NAME.txt exists, click ENTER to delete it, or CTRL+C to cnacel"
-	read
-	rm /tmp/CROWDAQ_TASK_LIST_$TASK_NAME.txt
-fi
-
 python cli.py -c $CROWDAQ_FILE login
 
-python cli.py -c $CROWDAQ_FILE get `list_task_repo_url_prefix`/$TASK_NAME | jq -r '.assignment_count[] | select(.count<3) | .task_id' > /tmp/unfinished_tasks.txt
-
-
-while read p; do
-    URL_BASE=`cat $CROWDAQ_FILE | jq -r '.site_url + "/w/task/" + .user  '`
-    echo $URL_BASE/$TASK_NAME/$p >> /tmp/CROWDAQ_TASK_LIST_$TASK_NAME.txt
-done < /tmp/unfinished_tasks.txt
-#
-#echo DONE
-#
-python mturk_cli.py -p mturk_default launch-main-task-from-urlfile example_project/example_mturk_config.json /tmp/CROWDAQ_TASK_LIST_$TASK_NAME.txt
+# Launches one HIT per missing assignment of every task with fewer than 3, straight from the task report.
+python mturk_cli.py -p mturk_default reissue example_project/example_mturk_config.json task/$CROWDAQ_USER/$TASK_NAME \
+	--target 3 --crowdaq-config $CROWDAQ_FILE
@@ -0,0 +1,163 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from os.path import expanduser
+
+from mturk_utils import paginate_pages
+
+
+def default_index_path(profile, sandbox):
+    return expanduser(f"~/.crowdaq/mturk_hits_{profile}_{'sandbox' if sandbox else 'production'}.sqlite")
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+class HitIndex(object):
+    """
+    Local SQLite copy of the HITs of an MTurk account, so that HITs can be looked up by group,
+    qualification or status without paging through list_hits every time.
+
+    ListHITs documents no order, so refresh() looks for new HITs at both ends of the listing: from the first page
+    until a page holds only indexed HITs, and from the last page of the previous refresh, whose NextToken is kept,
+    to the end. Status changes of older HITs are only picked up by a full refresh, or recorded locally through
+    mark_expired.
+    """
+
+    def __init__(self, path):
+        self.path = expanduser(path)
+        index_dir = os.path.dirname(self.path)
+        if index_dir and not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS hits ("
+                " hit_id TEXT PRIMARY KEY, group_id TEXT, hit_type_id TEXT, status TEXT,"
+                " creation_time REAL, expiration REAL, refreshed_at REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS hits_group_id ON hits (group_id)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS hits_status ON hits (status)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS hit_qualifications ("
+                " hit_id TEXT, qualification_id TEXT, PRIMARY KEY (hit_id, qualification_id))")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS hit_qualifications_qualification_id"
+                " ON hit_qualifications (qualification_id)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def upsert(self, hits):
+        now = datetime.now(timezone.utc).timestamp()
+        with self.lock, self.conn:
+            for hit in hits:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (hit['HITId'], hit.get('HITGroupId'), hit.get('HITTypeId'), hit.get('HITStatus'),
+                     _timestamp(hit.get('CreationTime')), _timestamp(hit.get('Expiration')), now))
+                self.conn.execute("DELETE FROM hit_qualifications WHERE hit_id = ?", (hit['HITId'],))
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO hit_qualifications VALUES (?, ?)",
+                    [(hit['HITId'], q['QualificationTypeId']) for q in hit.get('QualificationRequirements', [])])
+
+    def refresh(self, client, full=False):
+        """
+        return: number of HITs fetched from MTurk
+        """
+        with self.lock:
+            known = set() if full else {row[0] for row in self.conn.execute("SELECT hit_id FROM hits")}
+            tail_token = None if full else self._get_meta('tail_token')
+        fetched = [0]
+
+        def scan(next_token, stop_at_known):
+            """
+            return: NextToken of the last page, or False when the scan stopped at a page of indexed HITs
+            """
+            token = next_token
+            for response in paginate_pages(client.list_hits, prefetch=not stop_at_known, next_token=next_token):
+                page = response['HITs']
+                fetched[0] += len(page)
+                self.upsert(page)
+                if not response.get('NextToken'):
+                    return token
+                if stop_at_known and all(hit['HITId'] in known for hit in page):
+                    return False
+                token = response['NextToken']
+
+        last_token = scan(None, stop_at_known=bool(known))
+        if last_token is False:
+            try:
+                last_token = scan(tail_token, stop_at_known=False) if tail_token else scan(None, stop_at_known=False)
+            except Exception:
+                # The NextToken kept by the previous refresh is no longer accepted.
+                logging.debug("Continuing the previous listing of HITs failed, listing every HIT", exc_info=True)
+                last_token = scan(None, stop_at_known=False)
+        with self.lock, self.conn:
+            if last_token:
+                self._set_meta('tail_token', last_token)
+            else:
+                self.conn.execute("DELETE FROM meta WHERE key = 'tail_token'")
+            self._set_meta('refreshed_at', datetime.now(timezone.utc).timestamp())
+        return fetched[0]
+
+    def mark_expired(self, hit_ids):
+        now = datetime.now(timezone.utc).timestamp()
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE hits SET expiration = ? WHERE hit_id = ?",
+                                  [(now, hit_id) for hit_id in hit_ids])
+
+    def hits(self, group_id=None, qualification_id=None, status=None, active_only=False):
+        """
+        active_only: leave out disposed HITs and HITs whose expiration has passed
+        return: list of dicts with the fields of list_hits that the index keeps
+        """
+        query = ("SELECT h.hit_id, h.group_id, h.hit_type_id, h.status, h.creation_time, h.expiration FROM hits h")
+        conditions, params = [], []
+        if qualification_id:
+            query += " JOIN hit_qualifications q ON q.hit_id = h.hit_id"
+            conditions.append("q.qualification_id = ?")
+            params.append(qualification_id)
+        if group_id:
+            conditions.append("h.group_id = ?")
+            params.append(group_id)
+        if status:
+            conditions.append("h.status = ?")
+            params.append(status)
+        if active_only:
+            conditions.append("(h.expiration IS NULL OR h.expiration > ?) AND h.status IS NOT 'Disposed'")
+            params.append(datetime.now(timezone.utc).timestamp())
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY h.creation_time"
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [
+            {
+                'HITId': hit_id,
+                'HITGroupId': group_id,
+                'HITTypeId': hit_type_id,
+                'HITStatus': status,
+                'CreationTime': None if creation_time is None else datetime.fromtimestamp(creation_time, timezone.utc),
+                'Expiration': None if expiration is None else datetime.fromtimestamp(expiration, timezone.utc),
+            }
+            for hit_id, group_id, hit_type_id, status, creation_time, expiration in rows
+        ]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+
+
+class LaunchJournal(object):
+    """
+    Append-only JSON lines record of a HIT launch.
+
+    The first line holds the launch id; every other line is one created HIT
+    ({"url", "replica", "hitid", "groupId", "start-time", "expire-at"}), flushed to disk as soon as the HIT exists,
+    so that an interrupted launch can be resumed without creating the same HITs again.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = []
+        self.launch_id = None
+        if resume and os.path.isfile(path):
+            self._load()
+        elif os.path.isfile(path) and os.path.getsize(path) > 0:
+            raise ValueError(f"Journal {path} already exists, pass --resume to continue that launch")
+
+        journal_dir = os.path.dirname(path)
+        if journal_dir and not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+        self.output_fd = open(path, "a")
+        if self.launch_id is None:
+            self.launch_id = uuid.uuid4().hex
+            self._append({"launch_id": self.launch_id, "started": str(datetime.now())})
+
+    def _load(self):
+        with open(self.path) as input_fd:
+            for line in input_fd:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted write.
+                    continue
+                if 'launch_id' in entry:
+                    self.launch_id = entry['launch_id']
+                else:
+                    self.entries.append(entry)
+
+    def _append(self, entry):
+        self.output_fd.write(json.dumps(entry, sort_keys=True) + "\n")
+        self.output_fd.flush()
+        os.fsync(self.output_fd.fileno())
+
+    def launched(self):
+        return {(entry['url'], entry['replica']) for entry in self.entries}
+
+    def request_token(self, url, replica):
+        """
+        Idempotency token for create_hit: MTurk rejects a second HIT with the same token, so a HIT created
+        right before a crash, but missing from the journal, is not created twice on resume.
+        """
+        return hashlib.sha1(f"{self.launch_id}|{url}|{replica}".encode('utf-8')).hexdigest()
+
+    def record(self, url, replica, hit, expire_at):
+        entry = {
+            'url': url,
+            'replica': replica,
+            'hitid': hit['HIT']['HITId'],
+            'groupId': hit['HIT']['HITGroupId'],
+            'start-time': str(datetime.now()),
+            'expire-at': str(expire_at),
+        }
+        self._append(entry)
+        self.entries.append(entry)
+        return entry
+
+    def close(self):
+        self.output_fd.close()
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+# Path segments kept as they are in endpoint templates; every other segment past /api/<type> is a parameter.
+LITERAL_SEGMENTS = {"response", "report", "questions", "new_assignment"}
+# Name of the parameter that follows a literal segment.
+SEGMENT_PARAMETERS = {"response": "{ids}", "questions": "{question}"}
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+def endpoint_template(url, site_url=""):
+    """
+    /api/exam/qiang/exam1/response/1-2-3 -> /api/exam/{user}/{name}/response/{ids}
+    """
+    if site_url and url.startswith(site_url):
+        url = url[len(site_url):]
+    parts = [p for p in urlparse(url).path.split("/") if p]
+    if len(parts) < 2 or parts[0] != "api":
+        return "/" + "/".join(parts)
+
+    template = parts[:2]
+    previous = None
+    for position, part in enumerate(parts[2:]):
+        if part in LITERAL_SEGMENTS:
+            template.append(part)
+        elif previous in SEGMENT_PARAMETERS:
+            template.append(SEGMENT_PARAMETERS[previous])
+        else:
+            template.append(["{user}", "{name}"][position] if position < 2 else "{id}")
+        previous = part
+    return "/" + "/".join(template)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class EndpointMetrics(object):
+    def __init__(self):
+        self.latencies = []
+        self.statuses = defaultdict(int)
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_wire_bytes = 0
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            "count": len(latencies),
+            "statuses": dict(self.statuses),
+            "retries": self.retries,
+            "request_bytes": self.request_bytes,
+            "response_wire_bytes": self.response_wire_bytes,
+            "latency_seconds": {
+                "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                "max": latencies[-1] if latencies else 0.0,
+                **{f"p{int(q * 100)}": percentile(latencies, q) for q in QUANTILES},
+            },
+        }
+
+
+class RequestMetrics(object):
+    """
+    Thread-safe aggregate of the requests made through a Client, per (method, endpoint template).
+
+    A request is recorded once, after its last attempt: latency covers every retry and backoff, status is the
+    final status code, or the exception name when no response came back.
+    """
+
+    def __init__(self, site_url=""):
+        self.site_url = site_url
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointMetrics)
+
+    def record(self, method, url, status, latency, request_bytes=0, response_wire_bytes=0, retries=0):
+        key = (method, endpoint_template(url, self.site_url))
+        with self.lock:
+            endpoint = self.endpoints[key]
+            endpoint.latencies.append(latency)
+            endpoint.statuses[str(status)] += 1
+            endpoint.retries += retries
+            endpoint.request_bytes += request_bytes
+            endpoint.response_wire_bytes += response_wire_bytes
+
+    def summary(self):
+        with self.lock:
+            endpoints = [dict(method=method, endpoint=endpoint, **metrics.summary())
+                         for (method, endpoint), metrics in sorted(self.endpoints.items())]
+        totals = {
+            "requests": sum(e["count"] for e in endpoints),
+            "errors": sum(count for e in endpoints for status, count in e["statuses"].items()
+                          if not status.isdigit() or int(status) >= 400),
+            "retries": sum(e["retries"] for e in endpoints),
+            "request_bytes": sum(e["request_bytes"] for e in endpoints),
+            "response_wire_bytes": sum(e["response_wire_bytes"] for e in endpoints),
+            "latency_seconds_sum": sum(e["latency_seconds"]["mean"] * e["count"] for e in endpoints),
+        }
+        return {"totals": totals, "endpoints": endpoints}
+
+    def to_prometheus(self, prefix="crowdaq_client"):
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_requests_total Requests by final status.",
+            f"# TYPE {prefix}_requests_total counter",
+        ]
+        for e in summary["endpoints"]:
+            for status, count in sorted(e["statuses"].items()):
+                lines.append(f'{prefix}_requests_total{{method="{e["method"]}",endpoint="{e["endpoint"]}",'
+                             f'status="{status}"}} {count}')
+        lines += [
+            f"# HELP {prefix}_request_duration_seconds Request latency including retries.",
+            f"# TYPE {prefix}_request_duration_seconds summary",
+        ]
+        for e in summary["endpoints"]:
+            labels = f'method="{e["method"]}",endpoint="{e["endpoint"]}"'
+            for q in QUANTILES:
+                lines.append(f'{prefix}_request_duration_seconds{{{labels},quantile="{q}"}} '
+                             f'{e["latency_seconds"][f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{{labels}}} '
+                         f'{e["latency_seconds"]["mean"] * e["count"]:.6f}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{{labels}}} {e["count"]}')
+        lines += [
+            f"# HELP {prefix}_retries_total Retried attempts.",
+            f"# TYPE {prefix}_retries_total counter",
+        ]
+        for e in summary["endpoints"]:
+            lines.append(f'{prefix}_retries_total{{method="{e["method"]}",endpoint="{e["endpoint"]}"}} '
+                         f'{e["retries"]}')
+        lines += [
+            f"# HELP {prefix}_bytes_total Bytes of request and response bodies on the wire, i.e. compressed.",
+            f"# TYPE {prefix}_bytes_total counter",
+        ]
+        for e in summary["endpoints"]:
+            labels = f'method="{e["method"]}",endpoint="{e["endpoint"]}"'
+            lines.append(f'{prefix}_bytes_total{{{labels},direction="sent"}} {e["request_bytes"]}')
+            lines.append(f'{prefix}_bytes_total{{{labels},direction="received"}} {e["response_wire_bytes"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path):
+        # Atomic, so a textfile collector never reads a partial dump.
+        _write_atomic(path, self.to_prometheus())
+
+
+def _write_atomic(path, content):
+    with open(path + ".tmp", "w") as output_fd:
+        output_fd.write(content)
+    os.replace(path + ".tmp", path)
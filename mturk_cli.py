@@ -1,15 +1,19 @@
 #!/usr/bin/env python3
 import json
+import random
+import sys
 
 import click
 import logging
 from os import path
 from mturk_utils import *
-import xml.etree.cElementTree as ET
-from tqdm import tqdm
 from math import ceil
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime,timedelta
+from launch_journal import LaunchJournal
+# boto3 (through getClientFromProfile), tqdm, ElementTree and the sqlite HIT index are imported by the commands
+# that need them, so that every invocation does not pay for all of them.
 
 
 @click.group()
@@ -71,6 +75,8 @@ def build_external_url_question(
         height=1600,
         ext_question_xmlns="http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/2006-07-14/ExternalQuestion.xsd"
     ):
+    import xml.etree.cElementTree as ET
+
     EQ_ROOT = ET.Element("ExternalQuestion")
     EQ_ROOT.set("xmlns", ext_question_xmlns)
 
@@ -88,14 +94,49 @@ def build_external_url_question(
     return question_xml
 
 
+def create_hit_for_url(client, ext_hit_url, mturk_config, meta, qualification_requirements,
+                       unique_request_token=None):
+    eqxml = build_external_url_question(ext_hit_url)
+    extra = {}
+    if unique_request_token:
+        # The annotation finds the HIT again when a resumed launch is told the token was already used.
+        extra['UniqueRequestToken'] = unique_request_token
+        extra['RequesterAnnotation'] = unique_request_token
+    return call_with_backoff(
+        client.create_hit,
+        Title=meta['title'],
+        Description=meta['description'],
+        Keywords=meta['keywords'],
+        Reward=str(mturk_config['reward_per_hit']),
+        MaxAssignments=1,
+        LifetimeInSeconds=eval(mturk_config['lifetime_min']) * 60,
+        AssignmentDurationInSeconds=eval(
+            mturk_config['session_duration_min']
+        ) * 60,
+        AutoApprovalDelayInSeconds=eval(
+            mturk_config['auto_approval_min']
+        ) * 60,
+        Question=eqxml,
+        QualificationRequirements=qualification_requirements,
+        **extra
+    )
+
+
 @cli.command('launch-task')
 @click.argument('config_file')
 @click.option('--url_file', default=None)
 @click.option('--url','-u',default=None)
 @click.option('--logdir','-l',default=None)
+@click.option('--concurrency', default=8, type=int, help="Number of HITs created in parallel.")
+@click.option('--journal', 'journal_path', default=None,
+              help="Append-only record of created HITs. Defaults to a new file in logdir.")
+@click.option('--resume', is_flag=True, help="Skip the HITs already recorded in --journal.")
 @click.pass_context
-def launch_hits(ctx, config_file, url_file, url, logdir):
+def launch_hits(ctx, config_file, url_file, url, logdir, concurrency, journal_path, resume):
     click.echo('Launching hits on MTurk\n')
+    if resume and not journal_path:
+        print('--resume needs the --journal of the launch to continue.')
+        return
     mturk_config, meta, qualification_requirements \
         = parse_mturk_params(config_file)
     client = getClientFromProfile(
@@ -117,71 +158,268 @@ def launch_hits(ctx, config_file, url_file, url, logdir):
         print('Missing url or url files.')
         return
 
-    print("Available balance before launch:",
-          client.get_account_balance()['AvailableBalance'])
-
-    expected_cost = mturk_config['reward_per_hit']
-    overhead = 1.2
-    if mturk_config['require_master']:
-        overhead += 0.05
-    expected_cost *= overhead*len(external_hit_urls)*mturk_config['num_of_hits']
-
-    print(f"Expected cost: ${expected_cost:.2f}")
     num_of_hits_per_url = 1
     if mturk_config['num_of_hits']:
         num_of_hits_per_url = mturk_config['num_of_hits']
 
-    print(f"You are about to launch {len(external_hit_urls)*num_of_hits_per_url} hit(s)")
-    if len(external_hit_urls)>10:
+    if mturk_config['sandbox'] and len(external_hit_urls)>100:
+        print("This is launching to the sandbox. Limiting hit to 100.")
+        external_hit_urls = external_hit_urls[:100]
+
+    jobs = []
+    occurrences = defaultdict(int)
+    for ext_hit_url in external_hit_urls:
+        # The same url may be listed several times, each occurrence asking for num_of_hits_per_url more HITs.
+        first = occurrences[ext_hit_url] * num_of_hits_per_url
+        occurrences[ext_hit_url] += 1
+        jobs += [(ext_hit_url, replica) for replica in range(first, first + num_of_hits_per_url)]
+
+    journal = None
+    if resume:
+        # Resuming reads the existing journal without writing to it, so the launched HITs are left out of the
+        # confirmation and the cost estimate; a new journal is only created once the launch is confirmed.
+        try:
+            journal = open_journal(journal_path, logdir, resume)
+        except ValueError as e:
+            print(e)
+            return
+        launched = journal.launched()
+        jobs = [job for job in jobs if job not in launched]
+        print(f"{len(launched)} HIT(s) were already launched, {len(jobs)} left.")
+        if not jobs:
+            journal.close()
+            return
+
+    print("Available balance before launch:",
+          client.get_account_balance()['AvailableBalance'])
+    print(f"Expected cost: ${expected_cost(mturk_config, len(jobs)):.2f}")
+    job_urls = list(dict.fromkeys(ext_hit_url for ext_hit_url, _ in jobs))
+    print(f"You are about to launch {len(jobs)} hit(s)")
+    if len(job_urls)>10:
         print(f"Here're the first few:")
-    print("\n".join(external_hit_urls[:10]))
+    print("\n".join(job_urls[:10]))
     input("Now please go to these links to check if the pages are correct,"
           " and hit [Enter] to continue.")
 
-    all_urls = set()
-    if mturk_config['sandbox'] and len(external_hit_urls)>100:
+    if not resume:
+        try:
+            journal = open_journal(journal_path, logdir, resume)
+        except ValueError as e:
+            print(e)
+            return
+
+    hitgroup_hitids, all_urls, failures = create_hits(
+        client, jobs, mturk_config, meta, qualification_requirements, concurrency, journal)
+    report_launch(client, journal, hitgroup_hitids, all_urls, failures, logdir,
+                  mturk_config, meta, qualification_requirements)
+
+
+@cli.command('reissue')
+@click.argument('config_file')
+@click.argument('task')
+@click.option('--target', type=int, default=None,
+              help="Assignments wanted per task. Defaults to num_of_hits of the config.")
+@click.option('--logdir','-l',default=None)
+@click.option('--concurrency', default=8, type=int, help="Number of HITs created in parallel.")
+@click.option('--journal', 'journal_path', default=None,
+              help="Append-only record of created HITs. Defaults to a new file in logdir.")
+@click.option('--resume', is_flag=True, help="Skip the HITs already recorded in --journal.")
+@click.option('--yes', '-y', is_flag=True, help="Launch without asking for confirmation, e.g. in a top-up loop.")
+@click.option('--crowdaq-config', default="~/.crowdaq/config.json",
+              help="CrowdAQ client config used to fetch the task report.")
+@click.pass_context
+def reissue_task(ctx, config_file, task, target, logdir, concurrency, journal_path, resume, yes, crowdaq_config):
+    """
+    Launch HITs for the unfinished tasks of TASK (task/<user>/<name>): every task gets as many HITs as it misses
+    assignments to reach --target, according to its CrowdAQ task report.
+    """
+    from client import Client, resolve_resource_with_name
+
+    mturk_config, meta, qualification_requirements \
+        = parse_mturk_params(config_file)
+    if target is None:
+        target = mturk_config['num_of_hits'] or 1
+    with open(path.expanduser(crowdaq_config)) as f:
+        conf = json.load(f)
+    tasksets, resource_type, task_name = resolve_resource_with_name(task, Client(conf))
+    if resource_type != "taskset":
+        raise click.BadParameter(f"{task} is not a task resource (task/<user>/<name>)")
+
+    jobs = []
+    num_tasks = 0
+    for ext_hit_url, missing in tasksets.iter_unfinished_urls(task_name, target):
+        # Replicas continue from the assignments already made, so a journal recognises HITs of an earlier reissue.
+        jobs += [(ext_hit_url, replica) for replica in range(target - missing, target)]
+        num_tasks += 1
+    print(f"{num_tasks} task(s) have fewer than {target} assignments, {len(jobs)} HIT(s) are missing.")
+    if not jobs:
+        return
+
+    journal = None
+    if resume:
+        # Resuming reads the existing journal without writing to it, so the launched HITs are skipped before the
+        # confirmation; a new journal is only created once the launch is confirmed.
+        try:
+            journal = open_journal(journal_path, logdir, resume)
+        except ValueError as e:
+            print(e)
+            return
+    if journal:
+        launched = journal.launched()
+        jobs = [job for job in jobs if job not in launched]
+        print(f"{len(launched)} HIT(s) were already launched, {len(jobs)} left.")
+        if not jobs:
+            journal.close()
+            return
+
+    client = getClientFromProfile(
+        profile=ctx.obj['aws_profile'],
+        sandbox=mturk_config['sandbox'])
+    print("Available balance before launch:",
+          client.get_account_balance()['AvailableBalance'])
+    print(f"Expected cost: ${expected_cost(mturk_config, len(jobs)):.2f}")
+    if not yes:
+        print("\n".join(sorted({ext_hit_url for ext_hit_url, _ in jobs})[:10]))
+        input(f"About to launch {len(jobs)} hit(s), hit [Enter] to continue.")
+    if not resume:
+        try:
+            journal = open_journal(journal_path, logdir, resume)
+        except ValueError as e:
+            print(e)
+            return
+
+    if mturk_config['sandbox'] and len(jobs)>100:
         print("This is launching to the sandbox. Limiting hit to 100.")
-        external_hit_urls = external_hit_urls[:100]
+        jobs = jobs[:100]
+
+    hitgroup_hitids, all_urls, failures = create_hits(
+        client, jobs, mturk_config, meta, qualification_requirements, concurrency, journal)
+    report_launch(client, journal, hitgroup_hitids, all_urls, failures, logdir,
+                  mturk_config, meta, qualification_requirements)
+
+
+@cli.command('watch')
+@click.argument('tasks', nargs=-1, required=True)
+@click.option('--target', type=int, default=3, help="Assignments wanted per task.")
+@click.option('--interval', default=30.0, type=float, help="Seconds between polls of a report that keeps changing.")
+@click.option('--max-interval', default=600.0, type=float, help="Longest wait between polls of an unchanged report.")
+@click.option('--stall-after', default=3600.0, type=float,
+              help="Seconds without progress after which an unfinished task is reported as stalled.")
+@click.option('--top-up', 'top_up_config', default=None,
+              help="MTurk config file. Stalled tasks get one HIT per missing assignment.")
+@click.option('--max-hits', default=None, type=int, help="Maximum number of HITs launched by top-ups.")
+@click.option('--logdir','-l',default=None)
+@click.option('--concurrency', default=8, type=int, help="Number of HITs created in parallel.")
+@click.option('--events-out', default=None, help="Also append every event as a JSON line to this file.")
+@click.option('--crowdaq-config', default="~/.crowdaq/config.json",
+              help="CrowdAQ client config used to poll the task reports.")
+@click.pass_context
+def watch_tasks(ctx, tasks, target, interval, max_interval, stall_after, top_up_config, max_hits, logdir,
+                concurrency, events_out, crowdaq_config):
+    """
+    Follow the progress of TASKS (task/<user>/<name> ...) until every task has --target assignments.
+    """
+    from client import Client, resolve_resource_with_name
+    from task_watch import TaskWatcher, print_event
+
+    with open(path.expanduser(crowdaq_config)) as f:
+        conf = json.load(f)
+    crowdaq_client = Client(conf)
+
+    events_fd = open(events_out, "a") if events_out else None
+
+    def on_event(event):
+        print_event(event)
+        if events_fd:
+            events_fd.write(json.dumps(event) + "\n")
+            events_fd.flush()
+
+    top_up = None
+    journal = None
+    if top_up_config:
+        mturk_config, meta, qualification_requirements \
+            = parse_mturk_params(top_up_config)
+        client = getClientFromProfile(
+            profile=ctx.obj['aws_profile'],
+            sandbox=mturk_config['sandbox'])
+        journal = open_journal(None, logdir, False)
+        replicas = defaultdict(int)
+        budget = [max_hits]
+
+        def top_up(name, shortfalls):
+            # HITs still on offer, from launch-task or an earlier top-up, may yet fill the task.
+            outstanding = count_outstanding_assignments(client, [ext_hit_url for ext_hit_url, _ in shortfalls])
+            jobs = []
+            for ext_hit_url, missing in shortfalls:
+                missing -= outstanding.get(ext_hit_url, 0)
+                if budget[0] is not None:
+                    missing = min(missing, budget[0] - len(jobs))
+                # Replicas count every HIT launched for a url, so request tokens never repeat within the journal.
+                first = replicas[ext_hit_url]
+                replicas[ext_hit_url] += max(missing, 0)
+                jobs += [(ext_hit_url, replica) for replica in range(first, first + max(missing, 0))]
+            if budget[0] is not None:
+                budget[0] -= len(jobs)
+            if not jobs:
+                return 0
+            hitgroup_hitids, all_urls, failures = create_hits(
+                client, jobs, mturk_config, meta, qualification_requirements, concurrency, journal)
+            if logdir:
+                write_group_logs(logdir, hitgroup_hitids, mturk_config, meta, qualification_requirements)
+            return sum(len(hitids) for hitids in hitgroup_hitids.values())
+
+    watcher = TaskWatcher(target, interval=interval, max_interval=max_interval, stall_after=stall_after,
+                          on_event=on_event, top_up=top_up)
+    for task in tasks:
+        tasksets, resource_type, task_name = resolve_resource_with_name(task, crowdaq_client)
+        if resource_type != "taskset":
+            raise click.BadParameter(f"{task} is not a task resource (task/<user>/<name>)")
+        watcher.add(tasksets, task_name)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if journal:
+            journal.close()
+        if events_fd:
+            events_fd.close()
+
+
+def open_journal(journal_path, logdir, resume):
+    """
+    return: the LaunchJournal of journal_path, or of a new file in logdir, or None without either
+    """
+    if not journal_path and logdir:
+        journal_path = path.join(logdir, f"launch-{datetime.now().strftime('%Y%m%d-%H%M%S')}.journal.jsonl")
+    if not journal_path:
+        return None
+    journal = LaunchJournal(journal_path, resume=resume)
+    print(f"Recording launched HITs in {journal_path}, pass --journal {journal_path} --resume to continue this launch.")
+    return journal
+
+
+def expected_cost(mturk_config, num_hits):
+    overhead = 1.2
+    if mturk_config['require_master']:
+        overhead += 0.05
+    return mturk_config['reward_per_hit']*overhead*num_hits
 
-    hitgroup_hitids = defaultdict(list)
-    for ext_hit_url in tqdm(external_hit_urls):
-        eqxml = build_external_url_question(ext_hit_url)
-        new_hit = None
-        for _ in range(num_of_hits_per_url):
-            try:
-                new_hit = client.create_hit(
-                    Title=meta['title'],
-                    Description=meta['description'],
-                    Keywords=meta['keywords'],
-                    Reward=str(mturk_config['reward_per_hit']),
-                    MaxAssignments=1,
-                    LifetimeInSeconds=eval(mturk_config['lifetime_min']) * 60,
-                    AssignmentDurationInSeconds=eval(
-                        mturk_config['session_duration_min']
-                    ) * 60,
-                    AutoApprovalDelayInSeconds=eval(
-                        mturk_config['auto_approval_min']
-                    ) * 60,
-                    Question=eqxml,
-                    QualificationRequirements=qualification_requirements,
-                )
-                if not new_hit:
-                    print('Unexpected failure in hit creation.')
-                    print(ext_hit_url)
-                    continue
-                hitgroup_hitids[new_hit['HIT']['HITGroupId']].append({
-                    'hitid':new_hit['HIT']['HITId'],
-                    'start-time': str(datetime.now()),
-                    'expire-at': str(datetime.now()+timedelta(minutes=eval(mturk_config['lifetime_min'])))
-                })
-                url_prefix = "workersandbox" if mturk_config['sandbox'] else "worker"
-                group_id = new_hit["HIT"]["HITGroupId"]
-                url = \
-                    f"https://{url_prefix}.mturk.com/mturk/preview?groupId={group_id}"
-                all_urls.add(url)
-            except:
-                print('Unexpected failure in hit creation.')
-                print(ext_hit_url)
+
+def report_launch(client, journal, hitgroup_hitids, all_urls, failures, logdir,
+                  mturk_config, meta, qualification_requirements):
+    if journal:
+        journal.close()
+        hitgroup_hitids = defaultdict(list)
+        for entry in journal.entries:
+            hitgroup_hitids[entry['groupId']].append(
+                {'hitid': entry['hitid'], 'start-time': entry['start-time'], 'expire-at': entry['expire-at']})
+
+    for ext_hit_url, errors in failures.items():
+        print(f'Unexpected failure in hit creation ({len(errors)} failed).')
+        print(ext_hit_url)
+        for error in sorted(set(errors)):
+            print(f'  {error}')
 
     print("MTurk job url is:")
     for url in sorted(list(all_urls)):
@@ -190,22 +428,109 @@ def launch_hits(ctx, config_file, url_file, url, logdir):
           client.get_account_balance()['AvailableBalance'])
     if logdir:
         print(f'Saving group IDs and hit IDs to {logdir}/...')
-        for groupid, hitids in hitgroup_hitids.items():
-            log = {'mturk-config':mturk_config, 'meta':meta, 'qualifications':qualification_requirements,
-                   'groupId':groupid, 'hitIds':[]}
-            try:
-                with open(path.join(logdir, groupid + '.json')) as f:
-                    oldlog = json.load(f)
-                    assert log['mturk-config']==oldlog['mturk-config']
-                    assert log['meta']==oldlog['meta']
-                    assert log['qualifications']==oldlog['qualifications']
-                    assert log['groupId']==oldlog['groupId']
-                    log['hitIds']+=oldlog['hitIds']
-            except: pass
-            log['hitIds']+=hitids
+        write_group_logs(logdir, hitgroup_hitids, mturk_config, meta, qualification_requirements)
 
-            with open(path.join(logdir, groupid+'.json'), 'w') as f:
-                json.dump(log,f,indent=2,sort_keys=True)
+
+def create_hits(client, jobs, mturk_config, meta, qualification_requirements, concurrency, journal=None):
+    """
+    Create one HIT per (url, replica) job on a bounded thread pool.
+    return: hitgroup_hitids, the set of preview urls, failures (url -> list of errors)
+    """
+    from tqdm import tqdm
+
+    url_prefix = "workersandbox" if mturk_config['sandbox'] else "worker"
+    hitgroup_hitids = defaultdict(list)
+    all_urls = set()
+    failures = defaultdict(list)
+
+    def launched(ext_hit_url, replica, new_hit, expire_at):
+        group_id = new_hit["HIT"]["HITGroupId"]
+        if journal:
+            journal.record(ext_hit_url, replica, new_hit, expire_at)
+        hitgroup_hitids[group_id].append({
+            'hitid':new_hit['HIT']['HITId'],
+            'start-time': str(datetime.now()),
+            'expire-at': str(expire_at)
+        })
+        all_urls.add(f"https://{url_prefix}.mturk.com/mturk/preview?groupId={group_id}")
+
+    # request token -> (url, replica, error) of the jobs whose HIT was created by an interrupted run of the launch
+    duplicates = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, tqdm(total=len(jobs)) as progress:
+        futures = {
+            executor.submit(create_hit_for_url, client, ext_hit_url, mturk_config, meta, qualification_requirements,
+                            journal.request_token(ext_hit_url, replica) if journal else None):
+                (ext_hit_url, replica)
+            for ext_hit_url, replica in jobs
+        }
+        for future in as_completed(futures):
+            ext_hit_url, replica = futures[future]
+            progress.update(1)
+            try:
+                new_hit = future.result()
+            except Exception as e:
+                if journal and is_duplicate_request(e):
+                    duplicates[journal.request_token(ext_hit_url, replica)] = (ext_hit_url, replica, str(e))
+                    continue
+                failures[ext_hit_url].append(f"{get_error_code(e)}: {e}")
+                continue
+            if not new_hit:
+                failures[ext_hit_url].append('Unexpected failure in hit creation.')
+                continue
+            launched(ext_hit_url, replica, new_hit,
+                     datetime.now()+timedelta(minutes=eval(mturk_config['lifetime_min'])))
+
+    if duplicates:
+        found = find_requested_hits(client, duplicates)
+        print(f"{len(duplicates)} HIT(s) were created before the launch was interrupted, {len(found)} found again.")
+        for token, (ext_hit_url, replica, error) in duplicates.items():
+            if token not in found:
+                failures[ext_hit_url].append(f"{error} (not found in ListHITs)")
+                continue
+            hit = found[token]
+            expire_at = hit.get('Expiration')
+            if isinstance(expire_at, datetime):
+                expire_at = expire_at.astimezone().replace(tzinfo=None)
+            launched(ext_hit_url, replica, {'HIT': hit}, expire_at)
+    return hitgroup_hitids, all_urls, failures
+
+
+def find_requested_hits(client, duplicates):
+    """
+    duplicates: request token -> (url, replica, error) of the CreateHIT calls rejected for a reused token
+    return: request token -> HIT, matched by RequesterAnnotation or by the HIT id quoted in the error
+    """
+    found = {}
+    for hit in iter_hits(client):
+        for token, (_, _, error) in duplicates.items():
+            if hit.get('RequesterAnnotation') == token or hit['HITId'] in error:
+                found[token] = hit
+        if len(found) == len(duplicates):
+            break
+    return found
+
+
+def write_group_logs(logdir, hitgroup_hitids, mturk_config, meta, qualification_requirements):
+    for groupid, hitids in hitgroup_hitids.items():
+        log = {'mturk-config':mturk_config, 'meta':meta, 'qualifications':qualification_requirements,
+               'groupId':groupid, 'hitIds':[]}
+        try:
+            with open(path.join(logdir, groupid + '.json')) as f:
+                oldlog = json.load(f)
+                assert log['mturk-config']==oldlog['mturk-config']
+                assert log['meta']==oldlog['meta']
+                assert log['qualifications']==oldlog['qualifications']
+                assert log['groupId']==oldlog['groupId']
+                log['hitIds']+=oldlog['hitIds']
+        except FileNotFoundError:
+            pass
+        except (AssertionError, ValueError, KeyError):
+            print(f'[Warning] {groupid}.json was written by a different launch configuration, overwriting it.')
+        known = {x['hitid'] for x in log['hitIds']}
+        log['hitIds'] += [x for x in hitids if x['hitid'] not in known]
+
+        with open(path.join(logdir, groupid+'.json'), 'w') as f:
+            json.dump(log,f,indent=2,sort_keys=True)
 
 
 @cli.command()
@@ -214,10 +539,22 @@ def launch_hits(ctx, config_file, url_file, url, logdir):
 @click.option('--qualid', '-q', default='')
 @click.option('--logdir', '-l', default=None)
 @click.option('--clean', '-c', is_flag=True)
+@click.option('--concurrency', default=8, type=int, help="Number of HITs expired in parallel.")
+@click.option('--verify', type=click.Choice(['none', 'sample', 'all']), default='sample',
+              help="Which expired HITs to read back with get_hit to print their new expiry.")
+@click.option('--sample-size', default=5, type=int)
+@click.option('--use-index', is_flag=True, help="Look the group up in the local HIT index instead of listing every HIT.")
+@click.option('--index-path', default=None, help="Path of the local HIT index.")
+@click.option('--no-refresh', is_flag=True, help="With --use-index, only query the local index.")
 @click.pass_context
-def expire_hit_group(ctx, groupid, sandbox, qualid, logdir, clean):
+def expire_hit_group(ctx, groupid, sandbox, qualid, logdir, clean, concurrency, verify, sample_size,
+                     use_index, index_path, no_refresh):
+    from tqdm import tqdm
+    from hit_index import HitIndex, default_index_path
+
     click.echo(f'Expiring hit group {groupid} on MTurk')
     wanted_hit_ids = []
+    index = None
     use_log = not clean and logdir and path.exists(path.join(logdir,groupid+'.json'))
     if use_log:
         with open(path.join(logdir,groupid+'.json')) as f:
@@ -226,17 +563,44 @@ def expire_hit_group(ctx, groupid, sandbox, qualid, logdir, clean):
             wanted_hit_ids = [x['hitid'] for x in log['hitIds'] if datetime.fromisoformat(x['expire-at'])>datetime.now()]
     else:
         client = getClientFromProfile(ctx.obj['aws_profile'], sandbox=sandbox)
-        wanted_hit_ids, _ = list_hits_with_groupid(client, groupid, qual_id=qualid)
+        if use_index:
+            index = HitIndex(index_path or default_index_path(ctx.obj['aws_profile'], sandbox))
+        # HITs that already expired, e.g. in an earlier run, are not expired again.
+        wanted_hit_ids, _ = list_hits_with_groupid(client, groupid, qual_id=qualid, index=index, active_only=True,
+                                                   refresh=not no_refresh)
 
     hits_stopped = set()
-    for hit_id in wanted_hit_ids:
-        try:
-            client.update_expiration_for_hit(HITId=hit_id, ExpireAt=0)
-            hit = client.get_hit(HITId=hit_id)
-            new_expiry_date = hit['HIT']['Expiration']
-            print(f"{hit_id} will now expire at {new_expiry_date}")
-            hits_stopped.add(hit_id)
-        except: pass
+    failures = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(call_with_backoff, client.update_expiration_for_hit, HITId=hit_id, ExpireAt=0): hit_id
+            for hit_id in wanted_hit_ids
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            hit_id = futures[future]
+            try:
+                future.result()
+                hits_stopped.add(hit_id)
+            except Exception as e:
+                failures[hit_id] = f"{get_error_code(e)}: {e}"
+
+    to_verify = []
+    if verify == 'all':
+        to_verify = sorted(hits_stopped)
+    elif verify == 'sample':
+        to_verify = random.sample(sorted(hits_stopped), min(sample_size, len(hits_stopped)))
+    for hit_id in to_verify:
+        hit = call_with_backoff(client.get_hit, HITId=hit_id)
+        new_expiry_date = hit['HIT']['Expiration']
+        print(f"{hit_id} will now expire at {new_expiry_date}")
+
+    print(f"Expired {len(hits_stopped)}/{len(wanted_hit_ids)} HIT(s) of group {groupid}.")
+    if index is not None:
+        index.mark_expired(hits_stopped)
+    if failures:
+        print(f"Failed to expire {len(failures)} HIT(s):")
+        for hit_id, error in sorted(failures.items()):
+            print(f"  {hit_id}: {error}")
 
     if use_log:
         for hit in log['hitIds']:
@@ -246,6 +610,46 @@ def expire_hit_group(ctx, groupid, sandbox, qualid, logdir, clean):
             json.dump(log,f,indent=2,sort_keys=True)
 
 
+@cli.command('list-hits')
+@click.option('--sandbox/--real', '-s/-r', default=True)
+@click.option('--groupid', '-g', default=None)
+@click.option('--qualid', '-q', default=None)
+@click.option('--status', default=None, help="Assignable, Unassignable, Reviewable, Reviewing or Disposed.")
+@click.option('--index-path', default=None, help="Path of the local HIT index.")
+@click.option('--full-refresh', is_flag=True, help="Re-list every HIT of the account, e.g. to pick up status changes.")
+@click.option('--no-refresh', is_flag=True, help="Only query the local index.")
+@click.pass_context
+def list_hits(ctx, sandbox, groupid, qualid, status, index_path, full_refresh, no_refresh):
+    from hit_index import HitIndex, default_index_path
+
+    index = HitIndex(index_path or default_index_path(ctx.obj['aws_profile'], sandbox))
+    if not no_refresh:
+        client = getClientFromProfile(ctx.obj['aws_profile'], sandbox=sandbox)
+        fetched = index.refresh(client, full=full_refresh)
+        print(f"Fetched {fetched} HIT(s) from MTurk.", file=sys.stderr)
+    for hit in index.hits(group_id=groupid, qualification_id=qualid, status=status):
+        print(f"{hit['HITId']}\t{hit['HITGroupId']}\t{hit['HITStatus']}\t{hit['CreationTime']}\t{hit['Expiration']}")
+
+
+def load_exam_report(report, crowdaq_config):
+    """
+    report: a report file, or an exam resource (exam/<user>/<exam>) whose report is fetched from CrowdAQ
+    """
+    if path.isfile(report):
+        with open(report) as f:
+            return json.load(f)
+    from client import Client, resolve_resource_with_name
+    with open(path.expanduser(crowdaq_config)) as f:
+        conf = json.load(f)
+    resources, resource_type, resource_id = resolve_resource_with_name(report, Client(conf))
+    if resource_type != "exam":
+        raise click.BadParameter(f"{report} is neither a file nor an exam resource")
+    exam_report = resources.get_report(resource_id)
+    if exam_report is None:
+        raise click.BadParameter(f"Cannot find the report of {report}")
+    return exam_report
+
+
 @cli.command('assign-qual')
 @click.argument('qualid')
 @click.argument('report')
@@ -253,23 +657,53 @@ def expire_hit_group(ctx, groupid, sandbox, qualid, logdir, clean):
 @click.option('--sandbox/--real', '-s/-r', default=True)
 @click.option('--dryrun', '-d', is_flag=True)
 @click.option('--verbose', '-v', is_flag=True)
+@click.option('--concurrency', default=8, type=int, help="Number of workers qualified in parallel.")
+@click.option('--results-out', default=None, help="Write the per-worker outcome to this JSON file.")
+@click.option('--sync', is_flag=True,
+              help="Only grant to new workers and workers whose grade changed, based on the current holders.")
+@click.option('--revoke', is_flag=True,
+              help="With --sync, also revoke the qualification from holders graded below the passing grade.")
+@click.option('--crowdaq-config', default="~/.crowdaq/config.json",
+              help="CrowdAQ client config used when REPORT is an exam resource (exam/<user>/<exam>).")
 @click.pass_context
-def give_qualifications_from_exam(ctx, qualid, report, passing_grade, sandbox, dryrun, verbose):
+def give_qualifications_from_exam(ctx, qualid, report, passing_grade, sandbox, dryrun, verbose, concurrency,
+                                  results_out, sync, revoke, crowdaq_config):
     click.echo(f'Assigning qualification {qualid} to workers with grade higher or equal to {passing_grade} in report {report}\n')
 
-    with open(report) as f:
-        report = json.load(f)
     if passing_grade>1:
         print('Passing grade should be in [0,1]')
         return
+    report = load_exam_report(report, crowdaq_config)
 
     workerIds = [r['worker_id'] for r in report['grades'] if r['grade']>=passing_grade]
     grades = [ceil(r['grade']*100) for r in report['grades'] if r['grade'] >= passing_grade]
 
     client = getClientFromProfile(ctx.obj['aws_profile'], sandbox=sandbox)
-    grant_qualification_to_workers(client, qualid, workerIds, grades, dryrun=dryrun, verbose=verbose)
-    return get_workerids_with_qualification_type(client,qualid)
-
+    results = []
+    if sync:
+        current = get_worker_qualification_values(client, qualid)
+        failing = [r['worker_id'] for r in report['grades'] if r['grade'] < passing_grade]
+        to_grant, to_revoke = diff_qualifications(current, dict(zip(workerIds, grades)),
+                                                  revoke=failing if revoke else ())
+        print(f'{len(current)} worker(s) hold the qualification: {len(to_grant)} to grant or update, '
+              f'{len(to_revoke)} to revoke, {len(workerIds) - len(to_grant)} already up to date.')
+        workerIds, grades = list(to_grant.keys()), list(to_grant.values())
+        if to_revoke:
+            results.append(remove_qualification_from_workers(client, qualid, to_revoke, dryrun=dryrun,
+                                                             verbose=verbose, concurrency=concurrency))
+
+    if workerIds or not sync:
+        results.append(grant_qualification_to_workers(client, qualid, workerIds, grades, dryrun=dryrun,
+                                                      verbose=verbose, concurrency=concurrency))
+    for result in results:
+        print(result.summary())
+        for wid, code, message in result.failed:
+            print(f'  {wid}: {code}')
+    if results_out:
+        with open(results_out, 'w') as f:
+            json.dump([result.to_json() for result in results], f, indent=2)
+    if not sync:
+        return get_workerids_with_qualification_type(client,qualid)
 
 
 if __name__ == '__main__':
@@ -1,17 +1,27 @@
-import boto3
+import re
 import string
 import random
-from datetime import datetime
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 
 MTURK_SANDBOX = 'https://mturk-requester-sandbox.us-east-1.amazonaws.com'
 MTURK_PROD = 'https://mturk-requester.us-east-1.amazonaws.com'
 
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'Throttling', 'TooManyRequestsException', 'ServiceUnavailable'}
+# randomString reseeds the global generator, so backoff jitter uses its own.
+_backoff_random = random.Random()
+
 def getClientFromProfile(profile, sandbox=False):
+    # boto3 alone takes longer to import than the rest of the CLI.
+    import boto3
     return boto3.Session(profile_name=profile).client('mturk', endpoint_url=MTURK_SANDBOX if sandbox else MTURK_PROD)
 
 def get_client_from_accessfile(access_file, sandbox=False):
     access_key_info = open(access_file).readlines()
     access_key, secret_access_key = access_key_info[-1].strip().split(",")
+    import boto3
     return boto3.client('mturk',
                         aws_access_key_id=access_key,
                         aws_secret_access_key=secret_access_key,
@@ -19,51 +29,172 @@ def get_client_from_accessfile(access_file, sandbox=False):
                         endpoint_url=MTURK_SANDBOX if sandbox else MTURK_PROD
                         )
 
+def get_error_code(e):
+    """Error code of a botocore ClientError, or the exception class name for anything else"""
+    response = getattr(e, 'response', None)
+    if isinstance(response, dict) and 'Error' in response:
+        return response['Error'].get('Code', type(e).__name__)
+    return type(e).__name__
+
+
+def is_duplicate_request(e):
+    """Whether CreateHIT was rejected because a HIT with its UniqueRequestToken already exists"""
+    response = getattr(e, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    # TurkErrorCode is a modeled field of RequestError, which botocore puts next to Error in the response.
+    turk_error_code = response.get('TurkErrorCode') or response.get('Error', {}).get('TurkErrorCode')
+    return turk_error_code == 'AWS.MechanicalTurk.HitAlreadyExists'
+
+
+def call_with_backoff(fn, max_retries=8, base_delay=0.5, max_delay=30, **kwargs):
+    """Call fn(**kwargs), retrying with exponential backoff and jitter while MTurk throttles us"""
+    attempt = 0
+    while True:
+        try:
+            return fn(**kwargs)
+        except Exception as e:
+            if get_error_code(e) not in THROTTLING_ERROR_CODES or attempt >= max_retries:
+                raise
+            time.sleep(_backoff_random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+            attempt += 1
+
+
 def randomString(stringLength):
     """Generate a random string with the combination of lowercase and uppercase letters """
     random.seed(int(datetime.now().timestamp()))
     letters = string.ascii_letters
     return ''.join(random.choice(letters) for i in range(stringLength))
 
+def paginate_pages(method, page_size=100, prefetch=False, next_token=None, **kwargs):
+    """
+    Lazily yield the responses of an MTurk list operation page by page, following NextToken.
+    next_token: NextToken of the first page to fetch, to continue an earlier pagination
+    With prefetch, the next page is requested on a background thread while the caller processes the current one.
+    Closing the generator early stops the pagination.
+    """
+    def fetch(token):
+        params = dict(kwargs, MaxResults=page_size)
+        if token:
+            params['NextToken'] = token
+        return call_with_backoff(method, **params)
+
+    if not prefetch:
+        token = next_token
+        while True:
+            response = fetch(token)
+            yield response
+            token = response.get('NextToken')
+            if not token:
+                return
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(fetch, next_token)
+    try:
+        while future is not None:
+            response = future.result()
+            token = response.get('NextToken')
+            future = executor.submit(fetch, token) if token else None
+            yield response
+    finally:
+        if future is not None:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def paginate(method, result_key, page_size=100, prefetch=False, **kwargs):
+    """Lazily yield the items under result_key of every page of an MTurk list operation"""
+    for response in paginate_pages(method, page_size=page_size, prefetch=prefetch, **kwargs):
+        yield from response[result_key]
+
+
+def iter_workers_with_qualification_type(client, qid, prefetch=False):
+    return paginate(client.list_workers_with_qualification_type, 'Qualifications', prefetch=prefetch,
+                    QualificationTypeId=qid)
+
+
 def get_workerids_with_qualification_type(client, qid):
     workers_union = set()
-    response = client.list_workers_with_qualification_type(
-        QualificationTypeId=qid,
-        MaxResults=100
-    )
-    workers_union = workers_union.union(set([x['WorkerId'] for x in response['Qualifications']]))
-    while 'NextToken' in response:
-        response = client.list_workers_with_qualification_type(
-            QualificationTypeId=qid,
-            MaxResults=100,
-            NextToken=response['NextToken']
-        )
-        workers_union = workers_union.union(set([x['WorkerId'] for x in response['Qualifications']]))
+    for x in iter_workers_with_qualification_type(client, qid, prefetch=True):
+        workers_union.add(x['WorkerId'])
     return list(workers_union)
 
 
-def get_all_hits(client, qual_id=''):
+def get_worker_qualification_values(client, qid):
+    """return: dict of worker id -> IntegerValue of every current holder of the qualification type"""
+    return {x['WorkerId']: x.get('IntegerValue') for x in iter_workers_with_qualification_type(client, qid, prefetch=True)}
+
+
+def diff_qualifications(current, wanted, revoke=()):
+    """
+    current: worker id -> value held now, wanted: worker id -> value it should hold,
+    revoke: worker ids that should not hold the qualification
+    return: (workers to grant, with their value, including changed values; holders to revoke)
+    """
+    to_grant = {wid: value for wid, value in wanted.items() if current.get(wid, None) != value}
+    to_revoke = [wid for wid in revoke if wid in current and wid not in wanted]
+    return to_grant, to_revoke
+
+
+def iter_hits(client, qual_id='', prefetch=False):
     if qual_id == '':
-        list_hits_response = client.list_hits(MaxResults=100)
+        return paginate(client.list_hits, 'HITs', prefetch=prefetch)
+    return paginate(client.list_hits_for_qualification_type, 'HITs', prefetch=prefetch,
+                    QualificationTypeId=qual_id)
+
+
+def get_all_hits(client, qual_id=''):
+    return list(iter_hits(client, qual_id, prefetch=True))
+
+
+def is_active(hit, now=None):
+    """
+    return: whether a HIT is neither disposed nor past its expiration
+    """
+    now = now or datetime.now(timezone.utc)
+    expiration = hit.get('Expiration')
+    if expiration is not None and expiration.tzinfo is None:
+        expiration = expiration.replace(tzinfo=timezone.utc)
+    return hit.get('HITStatus') != 'Disposed' and (expiration is None or expiration > now)
+
+
+def external_url_of_hit(hit):
+    """return: the ExternalURL of a HIT with an ExternalQuestion, None for other HITs"""
+    from xml.sax.saxutils import unescape
+    match = re.search(r"<ExternalURL>(.*?)</ExternalURL>", hit.get('Question') or '', re.S)
+    return unescape(match.group(1).strip()) if match else None
+
+
+def count_outstanding_assignments(client, urls):
+    """
+    return: url -> number of assignments that active HITs of the url still offer or have in progress,
+    for the urls that have any
+    """
+    urls = set(urls)
+    outstanding = defaultdict(int)
+    now = datetime.now(timezone.utc)
+    for hit in iter_hits(client, prefetch=True):
+        if not is_active(hit, now):
+            continue
+        url = external_url_of_hit(hit)
+        if url in urls:
+            outstanding[url] += hit.get('NumberOfAssignmentsAvailable', 0) + hit.get('NumberOfAssignmentsPending', 0)
+    return {url: count for url, count in outstanding.items() if count}
+
+
+def list_hits_with_groupid(client, group_id, qual_id='', index=None, active_only=False, refresh=True):
+    """
+    refresh: with an index, refresh it incrementally first; without, the index is queried as it is
+    """
+    if index is not None:
+        # A local query instead of paging through every HIT of the account.
+        if refresh:
+            index.refresh(client)
+        wanted_hits = index.hits(group_id=group_id, qualification_id=qual_id or None, active_only=active_only)
     else:
-        list_hits_response = client.list_hits_for_qualification_type(MaxResults=100,
-                                                                     QualificationTypeId=qual_id)
-    all_hits = list_hits_response['HITs']
-    while 'NextToken' in list_hits_response:
-        if qual_id == '':
-            list_hits_response = client.list_hits(MaxResults=100,
-                                                  NextToken=list_hits_response['NextToken'])
-        else:
-            list_hits_response = client.list_hits_for_qualification_type(MaxResults=100,
-                                                                         NextToken=list_hits_response['NextToken'],
-                                                                         QualificationTypeId=qual_id)
-        all_hits += list_hits_response['HITs']
-    return all_hits
-
-
-def list_hits_with_groupid(client, group_id, qual_id=''):
-    all_hits = get_all_hits(client, qual_id)
-    wanted_hits = [hit for hit in all_hits if hit['HITGroupId'] == group_id]
+        wanted_hits = [hit for hit in iter_hits(client, qual_id, prefetch=True) if hit['HITGroupId'] == group_id]
+        if active_only:
+            wanted_hits = [hit for hit in wanted_hits if is_active(hit)]
     wanted_hit_ids = [hit['HITId'] for hit in wanted_hits]
 
     if not wanted_hits:
@@ -72,53 +203,84 @@ def list_hits_with_groupid(client, group_id, qual_id=''):
     return wanted_hit_ids, wanted_hits
 
 
-def get_all_assignments_of_hit(client, hit_id):
-    assignments = []
-    response = client.list_assignments_for_hit(
-        HITId=hit_id,
-        MaxResults=100,
-        AssignmentStatuses=[
-            'Submitted', 'Approved',
-        ]
-    )
-    assignments += response['Assignments']
-    while 'NextToken' in response:
-        response = client.list_assignments_for_hit(
-            HITId=hit_id,
-            MaxResults=100,
-            AssignmentStatuses=[
-                'Submitted', 'Approved',
-            ],
-            NextToken=response['NextToken']
-        )
-        assignments += response['Assignments']
+def iter_assignments_of_hit(client, hit_id, prefetch=False):
+    return paginate(client.list_assignments_for_hit, 'Assignments', prefetch=prefetch,
+                    HITId=hit_id, AssignmentStatuses=['Submitted', 'Approved'])
+
 
+def get_all_assignments_of_hit(client, hit_id):
+    assignments = list(iter_assignments_of_hit(client, hit_id, prefetch=True))
     assignment_ids = [x['AssignmentId'] for x in assignments]
     return assignment_ids, assignments
 
-def grant_qualification_to_workers(client, qual_id, work_ids, grades=None, dryrun=True, verbose=True):
+class QualificationResult(object):
+    """Outcome of a bulk qualification update: succeeded and skipped worker ids, failed (worker id, code, message)"""
+
+    def __init__(self, action, qual_id):
+        self.action = action
+        self.qual_id = qual_id
+        self.succeeded = []
+        self.failed = []
+        self.skipped = []
+
+    def summary(self):
+        return (f'{self.action} qualification type {self.qual_id}: {len(self.succeeded)} succeeded, '
+                f'{len(self.failed)} failed, {len(self.skipped)} skipped')
+
+    def to_json(self):
+        return {
+            'action': self.action,
+            'qualification_type_id': self.qual_id,
+            'succeeded': self.succeeded,
+            'failed': [{'worker_id': wid, 'error_code': code, 'message': message}
+                       for wid, code, message in self.failed],
+            'skipped': self.skipped,
+        }
+
+
+def _update_workers_concurrently(result, calls, concurrency, verbose, describe):
+    """
+    calls: list of (worker id, fn, kwargs); describe(ix, worker id) is printed for each success when verbose
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(call_with_backoff, fn, **kwargs): wid for wid, fn, kwargs in calls}
+        for ix, future in enumerate(as_completed(futures)):
+            wid = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                result.failed.append((wid, get_error_code(e), str(e)))
+                print(f'Failed to {result.action.lower()} {wid} for qualification type {result.qual_id}: {e}')
+                continue
+            result.succeeded.append(wid)
+            if verbose:
+                print(describe(ix, wid))
+    return result
+
+
+def grant_qualification_to_workers(client, qual_id, work_ids, grades=None, dryrun=True, verbose=True, concurrency=8):
     if dryrun:
         verbose = True
     if not grades:
         grades = [1]*len(work_ids)
     assert len(grades)==len(work_ids)
-    for ix,wid in enumerate(work_ids):
-        try:
-            grade = grades[ix]
-            if dryrun:
-                print('Dry run:')
-            else:
-                response = client.associate_qualification_with_worker(
-                    QualificationTypeId=qual_id,
-                    WorkerId=wid,
-                    IntegerValue=grade,
-                    SendNotification=False
-                )
+    result = QualificationResult('Grant', qual_id)
+    grade_of = dict(zip(work_ids, grades))
+    if dryrun:
+        for ix,wid in enumerate(work_ids):
+            print('Dry run:')
+            print(f'{ix+1}/{len(work_ids)}: {wid} qualified for qualification type {qual_id} (grade={grades[ix]})')
+            result.skipped.append(wid)
+        return result
 
-            if verbose:
-                print(f'{ix+1}/{len(work_ids)}: {wid} qualified for qualification type {qual_id} (grade={grade})')
-        except:
-            print(f'Failed to qualify {wid} for qualification type {qual_id}')
+    calls = [
+        (wid, client.associate_qualification_with_worker,
+         dict(QualificationTypeId=qual_id, WorkerId=wid, IntegerValue=grade, SendNotification=False))
+        for wid, grade in zip(work_ids, grades)
+    ]
+    return _update_workers_concurrently(
+        result, calls, concurrency, verbose,
+        lambda ix, wid: f'{ix+1}/{len(work_ids)}: {wid} qualified for qualification type {qual_id} (grade={grade_of[wid]})')
 
 
 def grant_new_qualification_to_workers(client, workids, grades=None, qual_name='', qual_description='', dryrun=True):
@@ -133,19 +295,23 @@ def grant_new_qualification_to_workers(client, workids, grades=None, qual_name='
     return qual_id
 
 
-def remove_qualification_from_workers(client, qual_id, work_ids, dryrun=True):
-    for wid in work_ids:
-        try:
-            if not dryrun:
-                response = client.disassociate_qualification_from_worker(
-                    QualificationTypeId=qual_id,
-                    WorkerId=wid,
-                )
-            print(f'{wid} disassociates with qualification type {qual_id}')
-        except:
-            print(f'Failed to disassociates {wid} with qualification type {qual_id}')
+def remove_qualification_from_workers(client, qual_id, work_ids, dryrun=True, verbose=True, concurrency=8):
+    result = QualificationResult('Revoke', qual_id)
+    if dryrun:
+        for wid in work_ids:
+            print(f'Dry run: {wid} disassociates with qualification type {qual_id}')
+            result.skipped.append(wid)
+        return result
+
+    calls = [
+        (wid, client.disassociate_qualification_from_worker, dict(QualificationTypeId=qual_id, WorkerId=wid))
+        for wid in work_ids
+    ]
+    return _update_workers_concurrently(
+        result, calls, concurrency, verbose,
+        lambda ix, wid: f'{wid} disassociates with qualification type {qual_id}')
 
 
 def remove_all_workers_in_qualfication(client, qual_id, dryrun=True):
     workers = get_workerids_with_qualification_type(client, qual_id)
-    remove_qualification_from_workers(client, qual_id, workers, dryrun)
\ No newline at end of file
+    return remove_qualification_from_workers(client, qual_id, workers, dryrun)
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from client import resolve_many
+
+PROJECT_FILENAME = "project.json"
+STATE_FILENAME = ".crowdaq_push_state.json"
+# Fields of a definition that point at another resource of the same user.
+REFERENCE_FIELDS = {
+    "instruction_id": "instruction",
+    "tutorial_id": "tutorial",
+    "question_set_id": "question_set",
+}
+
+
+def load_definition(resource_type, file):
+    """
+    return: the body to upload for the definition file of a resource
+    """
+    with open(file) as file_input:
+        resource_def = file_input.read()
+
+    if resource_type == "instruction":
+        if file.endswith(".md"):
+            resource_def = json.dumps(
+                {
+                    "document": resource_def
+                }
+            )
+        elif file.endswith(".json"):
+            pass
+        else:
+            raise ValueError("Instruction definition file must ends with either md or json")
+    return resource_def
+
+
+class MarkdownDocument(object):
+    """
+    The body {"document": <markdown>} of a markdown instruction, produced chunk by chunk from the file,
+    so a large document is never held in memory. Iterating again reads the file again.
+    """
+
+    def __init__(self, path, chunk_size=64 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        yield '{"document": "'
+        with open(self.path) as file_input:
+            for chunk in iter(lambda: file_input.read(self.chunk_size), ''):
+                # Escaping is per character, so chunks can be escaped independently.
+                yield json.dumps(chunk)[1:-1]
+        yield '"}'
+
+
+def open_definition(resource_type, file):
+    """
+    Streaming counterpart of load_definition.
+    return: a binary file object, or a MarkdownDocument for markdown instructions, to pass to resource.update
+    """
+    if resource_type == "instruction" and not file.endswith(".json"):
+        if file.endswith(".md"):
+            return MarkdownDocument(file)
+        raise ValueError("Instruction definition file must ends with either md or json")
+    return open(file, 'rb')
+
+
+def content_hash(definition):
+    return hashlib.sha256(definition.encode('utf-8')).hexdigest()
+
+
+class ProjectResource(object):
+    def __init__(self, resource, file, depends_on):
+        self.resource = resource
+        self.file = file
+        self.depends_on = set(depends_on)
+        self.definition = None
+        self.hash = None
+
+
+def load_project(project_dir, user):
+    """
+    Read <project_dir>/project.json, a list of {"resource": ..., "file": ..., "depends_on": [...]} entries where
+    "{user}" in resource identifiers is replaced by the configured user.
+    Dependencies on resources referenced through instruction_id/tutorial_id/question_set_id are added automatically.
+    return: dict of resource identifier -> ProjectResource
+    """
+    with open(os.path.join(project_dir, PROJECT_FILENAME)) as input_fd:
+        manifest = json.load(input_fd)
+
+    resources = {}
+    for entry in manifest['resources']:
+        resource = entry['resource'].format(user=user).strip("/")
+        depends_on = [d.format(user=user).strip("/") for d in entry.get('depends_on', [])]
+        resources[resource] = ProjectResource(resource, os.path.join(project_dir, entry['file']), depends_on)
+
+    for item in resources.values():
+        resource_type = item.resource.split("/")[0]
+        item.definition = load_definition(resource_type, item.file)
+        item.hash = content_hash(item.definition)
+        if resource_type == "instruction":
+            continue
+        try:
+            definition = json.loads(item.definition)
+        except json.decoder.JSONDecodeError:
+            continue
+        if not isinstance(definition, dict):
+            continue
+        owner = item.resource.split("/")[1]
+        for field, referenced_type in REFERENCE_FIELDS.items():
+            if isinstance(definition.get(field), str):
+                referenced = f"{referenced_type}/{owner}/{definition[field]}"
+                if referenced in resources and referenced != item.resource:
+                    item.depends_on.add(referenced)
+
+    for item in resources.values():
+        missing = [d for d in item.depends_on if d not in resources]
+        if missing:
+            raise ValueError(f"{item.resource} depends on {missing}, which are not part of the project")
+    check_acyclic(resources)
+    return resources
+
+
+def check_acyclic(resources):
+    """
+    Raise a ValueError naming the resources of a dependency cycle, before push_project uploads anything.
+    """
+    done = set()
+    remaining = dict(resources)
+    while remaining:
+        ready = [name for name, item in remaining.items() if item.depends_on <= done]
+        if not ready:
+            raise ValueError(f"Dependency cycle between {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        done.update(ready)
+
+
+def load_state(project_dir):
+    path = os.path.join(project_dir, STATE_FILENAME)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as input_fd:
+        return json.load(input_fd)
+
+
+def save_state(project_dir, state):
+    path = os.path.join(project_dir, STATE_FILENAME)
+    with open(path + ".tmp", "w") as output_fd:
+        json.dump(state, output_fd, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def is_changed(item, resolved, state, compare):
+    if compare == "state":
+        return state.get(item.resource) != item.hash
+    # Compare canonical JSON against the copy on the server.
+    resources, _, resource_id = resolved
+    remote = resources.get(resource_id)
+    if remote is None:
+        return True
+    try:
+        local = json.loads(item.definition)
+    except json.decoder.JSONDecodeError:
+        return True
+    return json.dumps(local, sort_keys=True) != json.dumps(remote, sort_keys=True)
+
+
+def push_project(project_dir, client, user, compare="state", force=False, concurrency=8, dryrun=False):
+    """
+    Upload the resources of a project whose content changed, independent resources in parallel and
+    each resource only after the resources it depends on.
+    return: (uploaded, unchanged, failed) lists of resource identifiers
+    """
+    resources = load_project(project_dir, user)
+    state_key = client.site_url
+    all_state = load_state(project_dir)
+    state = all_state.setdefault(state_key, {})
+    resolved = dict(zip(resources, resolve_many(list(resources), client)))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        changed = {}
+        if force:
+            changed = {name: True for name in resources}
+        else:
+            futures = {name: executor.submit(is_changed, item, resolved[name], state, compare)
+                       for name, item in resources.items()}
+            changed = {name: future.result() for name, future in futures.items()}
+
+        uploaded, unchanged, failed = [], [], []
+        done = set()
+        running = {}
+        waiting = dict(resources)
+
+        def upload(item):
+            resource, _, resource_id = resolved[item.resource]
+            if resource.update(resource_id, item.definition) is None:
+                raise ValueError(f"Cannot find {resource.get_url(resource_id)}")
+
+        while waiting or running:
+            scheduled = True
+            while scheduled:
+                scheduled = False
+                for name in list(waiting):
+                    item = waiting[name]
+                    if item.depends_on & set(failed):
+                        logging.warning(f"Skipping {name} because one of its dependencies failed")
+                        failed.append(name)
+                    elif item.depends_on <= done:
+                        if not changed[name]:
+                            unchanged.append(name)
+                            done.add(name)
+                        elif dryrun:
+                            uploaded.append(name)
+                            done.add(name)
+                        else:
+                            running[executor.submit(upload, item)] = name
+                    else:
+                        continue
+                    del waiting[name]
+                    scheduled = True
+            if not running:
+                if waiting:
+                    raise ValueError(f"Dependency cycle between {sorted(waiting)}")
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Failed to push {name}: {e}")
+                    failed.append(name)
+                    continue
+                print(f"Pushed {name}")
+                uploaded.append(name)
+                state[name] = resources[name].hash
+                done.add(name)
+
+    if not dryrun:
+        save_state(project_dir, all_state)
+    return uploaded, unchanged, failed
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+import time
+from os.path import expanduser
+
+DEFAULT_CACHE_CONFIG = {
+    "enabled": False,
+    "path": "~/.crowdaq/cache.sqlite",
+    "ttl": 300,
+    "max_bytes": 64 * 1024 * 1024,
+}
+
+
+def cached_response(url, body):
+    from requests.models import Response
+
+    resp = Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = body
+    return resp
+
+
+class ResponseCache(object):
+    """
+    SQLite-backed cache of GET responses keyed by (user, url).
+
+    Entries younger than ttl seconds are served without touching the network. Older entries that carry an
+    ETag or Last-Modified are revalidated with a conditional request. The least recently used entries are
+    evicted once the stored bodies exceed max_bytes.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_CACHE_CONFIG['ttl'], max_bytes=DEFAULT_CACHE_CONFIG['max_bytes']):
+        self.path = expanduser(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " user TEXT NOT NULL, url TEXT NOT NULL, body BLOB NOT NULL, size INTEGER NOT NULL,"
+            " etag TEXT, last_modified TEXT, stored_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (user, url))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def lookup(self, user, url):
+        """
+        return: (body, etag, last_modified, fresh) or None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE user = ? AND url = ?",
+                (user, url)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE user = ? AND url = ?", (now, user, url))
+        body, etag, last_modified, stored_at = row
+        return body, etag, last_modified, now - stored_at < self.ttl
+
+    def store(self, user, url, body, etag=None, last_modified=None):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user, url, body, len(body), etag, last_modified, now, now))
+            self._evict()
+
+    def touch(self, user, url):
+        with self.lock:
+            self.conn.execute("UPDATE responses SET stored_at = ? WHERE user = ? AND url = ?",
+                              (time.time(), user, url))
+
+    def invalidate(self, user, url):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses WHERE user = ? AND url = ?", (user, url))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT user, url, size FROM responses ORDER BY accessed_at").fetchall()
+        for user, url, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE user = ? AND url = ?", (user, url))
+            total -= size
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
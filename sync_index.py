@@ -0,0 +1,140 @@
+import json
+import os
+from datetime import datetime
+
+from sync_store import sync_file_format, open_sync_file, iter_json_array, TRUNCATION_ERRORS
+
+INDEX_FILENAME = "crowdaq_sync_index.json"
+INDEX_VERSION = 1
+
+
+def scan_json_array(path):
+    """
+    Locate every record of a crowdaq_assignment_sync_*.json file.
+    return: list of [pid, offset], offset being the position of the record in the file
+    """
+    return [[record['pid'], offset] for offset, record in iter_json_array(path)]
+
+
+def scan_jsonl(path):
+    """
+    return: ([pid, offset] of every record, uncompressed length of the complete lines, whether the file ends cleanly).
+    The records read before a truncated line or compressed member are returned, with the file marked unclean.
+    """
+    records = []
+    length = 0
+    with open_sync_file(path, "rb") as input_fd:
+        try:
+            for line in input_fd:
+                if not line.endswith(b"\n"):
+                    return records, length, False
+                try:
+                    records.append([json.loads(line)['pid'], length])
+                except (ValueError, KeyError, TypeError):
+                    pass
+                length += len(line)
+        except TRUNCATION_ERRORS:
+            return records, length, False
+    return records, length, True
+
+
+class SyncIndex(object):
+    """
+    Sidecar manifest of an output folder of sync-response.
+
+    For every sync file it keeps the sync time, the file size and the [pid, offset] pairs it contains,
+    so that later syncs only need to read this file to know which responses are already on disk.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, INDEX_FILENAME)
+        self.files = {}
+
+    @classmethod
+    def load(cls, folder):
+        index = cls(folder)
+        if os.path.isfile(index.path):
+            with open(index.path) as input_fd:
+                try:
+                    data = json.load(input_fd)
+                except json.decoder.JSONDecodeError:
+                    print(f"Index {index.path} cannot be loaded, rebuilding it.")
+                    return index
+            if data.get('version') == INDEX_VERSION:
+                index.files = data['files']
+        return index
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as output_fd:
+            json.dump({"version": INDEX_VERSION, "files": self.files}, output_fd, separators=(",", ":"))
+            output_fd.flush()
+            os.fsync(output_fd.fileno())
+        os.replace(tmp_path, self.path)
+
+    def pids(self):
+        pids = set()
+        for entry in self.files.values():
+            for pid, _ in entry['records']:
+                pids.add(pid)
+        return pids
+
+    def add_file(self, filename, records, synced_at=None, length=None, complete=True):
+        """
+        Register records written into filename. Records of a file that is already indexed are appended,
+        which is how jsonl shards grow across syncs. length is the uncompressed size of jsonl shards, and
+        complete tells whether the file was closed cleanly and can be appended to.
+        """
+        if synced_at is None:
+            synced_at = datetime.now().isoformat()
+        entry = self.files.setdefault(filename, {"records": []})
+        entry['synced_at'] = synced_at
+        entry['size'] = os.path.getsize(os.path.join(self.folder, filename))
+        entry['records'] += records
+        entry['complete'] = complete
+        if length is not None:
+            entry['length'] = length
+
+    def index_file(self, filename):
+        fullpath = os.path.join(self.folder, filename)
+        file_format, _ = sync_file_format(filename)
+        records = []
+        length = None
+        complete = True
+        try:
+            if file_format == "json":
+                records = scan_json_array(fullpath)
+            else:
+                records, length, complete = scan_jsonl(fullpath)
+        except (ValueError, KeyError, EOFError, OSError):
+            # Remembered even when broken so that the file is not rescanned on every sync.
+            print(f"File {filename} cannot be loaded.")
+            complete = False
+        mtime = datetime.fromtimestamp(os.path.getmtime(fullpath)).isoformat()
+        self.add_file(filename, records, synced_at=mtime, length=length, complete=complete)
+
+    def refresh(self):
+        """
+        Index sync files missing from the manifest or changed since they were indexed,
+        and forget the ones that were removed.
+        return: True if the manifest changed
+        """
+        changed = False
+        on_disk = {f for f in os.listdir(self.folder) if sync_file_format(f) is not None}
+        for filename in list(self.files):
+            if filename not in on_disk:
+                del self.files[filename]
+                changed = True
+        for filename in sorted(on_disk):
+            entry = self.files.get(filename)
+            if entry is not None and entry['size'] == os.path.getsize(os.path.join(self.folder, filename)):
+                continue
+            self.files.pop(filename, None)
+            self.index_file(filename)
+            changed = True
+        return changed
+
+    def rebuild(self):
+        self.files = {}
+        self.refresh()
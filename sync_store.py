@@ -0,0 +1,249 @@
+import gzip
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+SYNC_FILE_PREFIX = "crowdaq_assignment_sync_"
+OUTPUT_FORMATS = ["json", "jsonl"]
+COMPRESSIONS = {
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+DEFAULT_SHARD_SIZE = 256 * 1024 * 1024
+SIZE_CHECK_INTERVAL = 256
+# Raised when reading a compressed shard whose last gzip member was cut short, e.g. by an interrupted append.
+TRUNCATION_ERRORS = (EOFError, zlib.error, gzip.BadGzipFile)
+
+
+def sync_file_format(filename):
+    """
+    return: (format, compression) of a sync file, or None if filename is not a sync file
+    """
+    if not filename.startswith(SYNC_FILE_PREFIX):
+        return None
+    if filename.endswith(".json"):
+        return "json", "none"
+    for compression, suffix in COMPRESSIONS.items():
+        if filename.endswith(".jsonl" + suffix):
+            return "jsonl", compression
+    return None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression requires the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def open_sync_file(path, mode="rb"):
+    """
+    Open a sync file for binary reading ("rb") or appending ("ab"), transparently (de)compressing it.
+    Appending to a compressed file adds a new gzip member / zstd frame, which readers concatenate.
+    """
+    _, compression = sync_file_format(os.path.basename(path))
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        zstandard = _zstandard()
+        raw = open(path, mode)
+        if mode == "rb":
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+            return io.BufferedReader(reader)
+        return zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+    return open(path, mode)
+
+
+def iter_jsonl_lines(path):
+    """
+    return: yields (offset, record) for every complete line, offset being in uncompressed bytes
+    """
+    offset = 0
+    with open_sync_file(path, "rb") as input_fd:
+        try:
+            for line in input_fd:
+                start = offset
+                offset += len(line)
+                if not line.endswith(b"\n"):
+                    # Trailing line of an interrupted write.
+                    break
+                try:
+                    yield start, json.loads(line)
+                except ValueError:
+                    continue
+        except TRUNCATION_ERRORS:
+            print(f"File {os.path.basename(path)} is truncated.")
+
+
+def iter_json_array(path):
+    """
+    return: yields (offset, record) for every record of a crowdaq_assignment_sync_*.json array, offset being the
+    position of the record in the file
+    """
+    with open(path) as input_fd:
+        text = input_fd.read()
+
+    decoder = json.JSONDecoder()
+    pos = text.index("[") + 1
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] == "]":
+            return
+        record, end = decoder.raw_decode(text, pos)
+        yield pos, record
+        pos = end
+
+
+def iter_records(folder):
+    """
+    Lazily iterate every record synced into folder, oldest file first, whatever its format.
+    A response synced more than once is yielded once, from the file it was last synced into according to the sync
+    index.
+    """
+    from sync_index import SyncIndex
+
+    index = SyncIndex.load(folder)
+    index.refresh()
+    latest = {}
+    for filename in sorted(index.files, key=lambda f: (index.files[f].get('synced_at', ''), f)):
+        for pid, offset in index.files[filename]['records']:
+            latest[pid] = (filename, offset)
+
+    for filename in sorted(os.listdir(folder)):
+        file_format = sync_file_format(filename)
+        if file_format is None:
+            continue
+        fullpath = os.path.join(folder, filename)
+        if file_format[0] == "json":
+            records = iter_json_array(fullpath)
+        else:
+            records = iter_jsonl_lines(fullpath)
+        try:
+            for offset, record in records:
+                if latest.get(record.get('pid'), (filename, offset)) == (filename, offset):
+                    yield record
+        except ValueError:
+            print(f"File {filename} cannot be loaded.")
+
+
+class JsonArrayWriter(object):
+    """
+    Streams records into a new pretty-printed crowdaq_assignment_sync_*.json array.
+    The file is written as .part and renamed on close so an interrupted sync never leaves a truncated file.
+    """
+
+    def __init__(self, folder, index):
+        self.folder = folder
+        self.index = index
+        self.synced_at = datetime.now()
+        self.filename = f"{SYNC_FILE_PREFIX}{self.synced_at.strftime('%Y-%m-%d-%H-%M-%S')}.json"
+        self.partial_path = os.path.join(folder, self.filename) + ".part"
+        self.output_fd = open(self.partial_path, "w")
+        self.output_fd.write("[")
+        self.offset = 1
+        self.records = []
+
+    def write(self, record):
+        separator = ",\n" if self.records else "\n"
+        # json.dumps escapes non-ASCII characters, so string lengths are byte offsets.
+        text = json.dumps(record, indent=2)
+        self.output_fd.write(separator)
+        self.output_fd.write(text)
+        self.offset += len(separator)
+        self.records.append([record['pid'], self.offset])
+        self.offset += len(text)
+
+    def close(self):
+        self.output_fd.write("\n]")
+        self.output_fd.close()
+        os.replace(self.partial_path, os.path.join(self.folder, self.filename))
+        self.index.add_file(self.filename, self.records, synced_at=self.synced_at.isoformat())
+        return [self.filename]
+
+
+class JsonlShardWriter(object):
+    """
+    Appends one compact JSON record per line to crowdaq_assignment_sync_*.jsonl[.gz|.zst] shards.
+    The newest cleanly closed shard is reused until it reaches shard_size bytes on disk, then a new shard is rolled.
+    """
+
+    def __init__(self, folder, index, compression="none", shard_size=DEFAULT_SHARD_SIZE):
+        if compression == "zstd":
+            _zstandard()
+        self.folder = folder
+        self.index = index
+        self.compression = compression
+        self.suffix = ".jsonl" + COMPRESSIONS[compression]
+        self.shard_size = shard_size
+        self.shard_seq = 0
+        self.synced_at = datetime.now()
+        self.written_files = []
+        self.output_fd = None
+        self._open_shard(self._latest_shard())
+
+    def _latest_shard(self):
+        shards = sorted(f for f in self.index.files
+                        if sync_file_format(f) == ("jsonl", self.compression))
+        if not shards:
+            return None
+        latest = shards[-1]
+        entry = self.index.files[latest]
+        if not entry.get('complete') or entry['size'] >= self.shard_size:
+            return None
+        if entry['size'] != os.path.getsize(os.path.join(self.folder, latest)):
+            return None
+        return latest
+
+    def _new_shard_name(self):
+        dt_string = self.synced_at.strftime('%Y-%m-%d-%H-%M-%S')
+        while True:
+            self.shard_seq += 1
+            filename = f"{SYNC_FILE_PREFIX}{dt_string}-{self.shard_seq:04d}{self.suffix}"
+            if not os.path.exists(os.path.join(self.folder, filename)):
+                return filename
+
+    def _open_shard(self, filename=None):
+        if filename is None:
+            filename = self._new_shard_name()
+            self.length = 0
+        else:
+            self.length = self.index.files[filename].get('length', 0)
+        self.filename = filename
+        self.raw_path = os.path.join(self.folder, filename)
+        self.output_fd = open_sync_file(self.raw_path, "ab")
+        self.records = []
+        # Until the shard is closed cleanly it must not be reused for appending.
+        self.index.add_file(filename, [], synced_at=self.synced_at.isoformat(), length=self.length, complete=False)
+        self.written_files.append(filename)
+
+    def _close_shard(self):
+        self.output_fd.close()
+        self.index.add_file(self.filename, self.records, synced_at=self.synced_at.isoformat(),
+                            length=self.length, complete=True)
+
+    def write(self, record):
+        # Checking the on-disk size is a syscall, so only do it every SIZE_CHECK_INTERVAL records.
+        if len(self.records) % SIZE_CHECK_INTERVAL == 0 and os.path.getsize(self.raw_path) >= self.shard_size:
+            self._close_shard()
+            self._open_shard()
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        self.output_fd.write(line)
+        self.records.append([record['pid'], self.length])
+        self.length += len(line)
+
+    def close(self):
+        self._close_shard()
+        return self.written_files
+
+
+def open_writer(output_format, folder, index, compression="none", shard_size=DEFAULT_SHARD_SIZE):
+    if output_format == "json":
+        if compression != "none":
+            raise ValueError("Compression is only available for the jsonl output format")
+        return JsonArrayWriter(folder, index)
+    return JsonlShardWriter(folder, index, compression=compression, shard_size=shard_size)
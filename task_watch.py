@@ -0,0 +1,149 @@
+"""
+Long-running watcher of the progress of CrowdAQ tasks.
+
+Every task report is polled with a conditional request, so an unchanged report costs a 304 instead of a download.
+The polling interval of a report doubles, up to max_interval, for as long as it does not change, and drops back to
+interval as soon as it does. Events (dicts with "time", "event" and "task") are emitted for:
+
+    start     the first report of a task
+    progress  assignments were added since the previous report
+    complete  tasks reached the target number of assignments
+    stall     unfinished tasks made no progress for stall_after seconds; reported once until they progress again
+    top-up    HITs were launched for stalled tasks
+    done      every task of the report reached the target; the report is no longer polled
+    error     the report could not be fetched
+"""
+import heapq
+import json
+import logging
+import random
+import time
+from datetime import datetime
+
+
+class WatchedTask(object):
+    def __init__(self, tasksets, name, interval):
+        self.tasksets = tasksets
+        self.name = name
+        self.interval = interval
+        self.validators = None
+        self.counts = None
+        self.changed_at = {}
+        self.complete = set()
+        self.stalled = set()
+        self.done = False
+
+
+class TaskWatcher(object):
+    """
+    top_up: function (task name, [(task url, missing assignments), ...]) -> number of HITs launched,
+    called with the tasks that just stalled
+    """
+
+    def __init__(self, target, interval=30.0, max_interval=600.0, stall_after=3600.0, on_event=None, top_up=None,
+                 clock=time.time, sleep=time.sleep):
+        self.target = target
+        self.interval = interval
+        self.max_interval = max_interval
+        self.stall_after = stall_after
+        self.on_event = on_event or print_event
+        self.top_up = top_up
+        self.clock = clock
+        self.sleep = sleep
+        self.tasks = []
+
+    def add(self, tasksets, name):
+        self.tasks.append(WatchedTask(tasksets, name, self.interval))
+
+    def emit(self, task, event, **fields):
+        self.on_event(dict(time=datetime.now().isoformat(timespec='seconds'), event=event, task=task.name, **fields))
+
+    def poll(self, task):
+        now = self.clock()
+        try:
+            report, task.validators = task.tasksets.poll_report(task.name, task.validators)
+        except (ValueError, OSError) as e:
+            logging.debug(f"Polling {task.name} failed", exc_info=True)
+            self.emit(task, "error", error=str(e))
+            task.interval = min(task.interval * 2, self.max_interval)
+            return
+        if report is None and task.counts is None:
+            self.emit(task, "error", error="task report not found")
+            task.interval = min(task.interval * 2, self.max_interval)
+            return
+
+        changed = report is not None and self.apply(task, report, now)
+        if changed:
+            task.interval = self.interval
+        else:
+            task.interval = min(task.interval * 2, self.max_interval)
+        if not task.done:
+            self.check_stalls(task, now)
+
+    def apply(self, task, report, now):
+        """
+        return: whether any assignment count changed
+        """
+        counts = {t['task_id']: t['count'] for t in report['assignment_count']}
+        newly_complete = [tid for tid, count in counts.items() if count >= self.target and tid not in task.complete]
+        task.complete.update(newly_complete)
+        if task.counts is None:
+            task.counts = counts
+            task.changed_at = dict.fromkeys(counts, now)
+            self.emit(task, "start", tasks=len(counts), complete=len(task.complete),
+                      assignments=sum(counts.values()))
+        else:
+            progressed = [tid for tid, count in counts.items() if count != task.counts.get(tid)]
+            if not progressed:
+                return False
+            added = sum(counts[tid] - task.counts.get(tid, 0) for tid in progressed)
+            for tid in progressed:
+                task.changed_at[tid] = now
+                task.stalled.discard(tid)
+            task.counts = counts
+            self.emit(task, "progress", tasks_progressed=len(progressed), assignments_added=added,
+                      complete=len(task.complete), tasks=len(counts))
+            if newly_complete:
+                self.emit(task, "complete", task_ids=sorted(newly_complete))
+
+        if counts and len(task.complete) == len(counts):
+            task.done = True
+            self.emit(task, "done", tasks=len(counts))
+        return True
+
+    def check_stalls(self, task, now):
+        stalled = [tid for tid, count in task.counts.items()
+                   if count < self.target and tid not in task.stalled
+                   and now - task.changed_at.get(tid, now) >= self.stall_after]
+        if not stalled:
+            return
+        task.stalled.update(stalled)
+        self.emit(task, "stall", task_ids=sorted(stalled))
+        if self.top_up is not None:
+            shortfalls = [(task.tasksets.get_task_url(task.name, tid), self.target - task.counts[tid])
+                          for tid in sorted(stalled)]
+            launched = self.top_up(task.name, shortfalls)
+            self.emit(task, "top-up", tasks=len(shortfalls), hits=launched)
+
+    def run(self, max_polls=None):
+        """
+        Poll the reports, each when it is due, until every task is done or max_polls polls were made.
+        """
+        queue = [(self.clock(), i) for i in range(len(self.tasks))]
+        heapq.heapify(queue)
+        polls = 0
+        while queue and (max_polls is None or polls < max_polls):
+            due, i = heapq.heappop(queue)
+            delay = due - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            task = self.tasks[i]
+            self.poll(task)
+            polls += 1
+            if not task.done:
+                # Jitter keeps the reports of many tasks from being polled in lockstep.
+                heapq.heappush(queue, (self.clock() + task.interval * random.uniform(0.9, 1.1), i))
+
+
+def print_event(event):
+    print(json.dumps(event), flush=True)
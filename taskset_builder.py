@@ -0,0 +1,280 @@
+"""
+Build TaskSet definitions from a document corpus and a task template.
+
+The template is the JSON of a single task. A string that is exactly "{{field}}" is replaced by the field of the
+document, whatever its type; "{{field}}" inside a longer string is replaced by its text. Fields can be nested
+("{{meta.title}}"), and "{{__index__}}" is the position of the document in the corpus.
+
+Documents are streamed, from a JSON array or from JSONL (optionally gzip-compressed), so the corpus is never loaded
+into memory; the tasks are written into shards {name}_0000.json, {name}_0001.json, ... of bounded size.
+"""
+import gzip
+import json
+import os
+import re
+from collections import deque
+
+PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z0-9_.]+)\s*\}\}")
+INDEX_FIELD = "__index__"
+DEFAULT_MAX_TASKS = 1000
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+RENDER_BATCH_SIZE = 256
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def open_documents(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def iter_json_array(file_input, chunk_size=READ_CHUNK_SIZE):
+    """
+    return: yields the elements of the JSON array in file_input, reading it chunk by chunk
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    # UTF-8 bytes of the input dropped from the buffer, to report errors at their offset in the file.
+    consumed = 0
+    eof = False
+    started = False
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ",")):
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Documents must be a JSON array or JSONL")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if not e.msg.startswith("Unterminated string") and any(
+                        c.isspace() or c in ",:]}" for c in buffer[e.pos:]):
+                    # The token at e.pos is complete, so reading more of the file cannot fix the error.
+                    offset = consumed + len(buffer[:e.pos].encode("utf-8"))
+                    raise ValueError(f"Invalid JSON in the array of documents at byte {offset}: {e.msg}")
+                element, end = None, None
+            # An element ending with the buffer may be a truncated number, so it is only trusted at the end of file.
+            if end is not None and (end < len(buffer) or eof):
+                yield element
+                pos = end
+                continue
+        if eof:
+            raise ValueError("Unexpected end of the JSON array of documents")
+        # Read at least as much as is buffered, so that a large element is parsed a logarithmic number of times.
+        chunk = file_input.read(max(chunk_size, len(buffer) - pos))
+        eof = not chunk
+        consumed += len(buffer[:pos].encode("utf-8"))
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def iter_documents(path):
+    """
+    return: yields the documents of a .json array or a .jsonl file, either of which may be gzip-compressed
+    """
+    with open_documents(path) as file_input:
+        if path.endswith(".jsonl") or path.endswith(".jsonl.gz"):
+            for line in file_input:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(file_input)
+
+
+def lookup(document, field, index):
+    if field == INDEX_FIELD:
+        return index
+    value = document
+    for key in field.split("."):
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            raise ValueError(f"Document {index} has no field {field}")
+    return value
+
+
+def compile_template(template):
+    """
+    return: function (document, index) -> task, with the placeholders of template located once up front
+    """
+    if isinstance(template, dict):
+        items = [(key, compile_template(value)) for key, value in template.items()]
+        return lambda document, index: {key: render(document, index) for key, render in items}
+    if isinstance(template, list):
+        renders = [compile_template(value) for value in template]
+        return lambda document, index: [render(document, index) for render in renders]
+    if isinstance(template, str):
+        match = PLACEHOLDER.fullmatch(template)
+        if match:
+            field = match.group(1)
+            return lambda document, index: lookup(document, field, index)
+        if PLACEHOLDER.search(template):
+            def substitute(document, index):
+                def text(m):
+                    value = lookup(document, m.group(1), index)
+                    return value if isinstance(value, str) else json.dumps(value)
+                return PLACEHOLDER.sub(text, template)
+            return substitute
+    return lambda document, index: template
+
+
+def render_batch(render, start, documents):
+    """
+    return: the tasks of documents, serialized to JSON
+    """
+    return [json.dumps(render(document, start + i)) for i, document in enumerate(documents)]
+
+
+_worker_render = None
+
+
+def _init_worker(template):
+    global _worker_render
+    _worker_render = compile_template(template)
+
+
+def _render_batch_in_worker(start, documents):
+    return render_batch(_worker_render, start, documents)
+
+
+def iter_batches(documents, batch_size=RENDER_BATCH_SIZE):
+    """
+    return: yields (index of the first document, documents) for consecutive batches
+    """
+    batch = []
+    start = 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield start, batch
+            start += len(batch)
+            batch = []
+    if batch:
+        yield start, batch
+
+
+def iter_tasks(documents, template, processes=1):
+    """
+    return: yields the serialized task of every document, in the order of the documents.
+    With several processes, only a bounded number of batches is in flight, so memory does not grow with the corpus.
+    """
+    if processes <= 1:
+        render = compile_template(template)
+        for start, batch in iter_batches(documents):
+            yield from render_batch(render, start, batch)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(template,)) as executor:
+        pending = deque()
+        for start, batch in iter_batches(documents):
+            pending.append(executor.submit(_render_batch_in_worker, start, batch))
+            if len(pending) >= processes * 4:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class ShardWriter(object):
+    """
+    Writes serialized tasks into TaskSet definitions of at most max_tasks tasks and max_bytes bytes.
+    A task larger than max_bytes on its own still gets a shard.
+    """
+
+    def __init__(self, output_dir, name, max_tasks=DEFAULT_MAX_TASKS, max_bytes=DEFAULT_MAX_BYTES, on_shard=None):
+        if max_tasks < 1:
+            raise ValueError("max_tasks must be at least 1")
+        self.output_dir = output_dir
+        self.name = name
+        self.max_tasks = max_tasks
+        self.max_bytes = max_bytes
+        self.on_shard = on_shard
+        self.shards = []
+        self.output_fd = None
+        self.count = 0
+        self.size = 0
+
+    def write(self, task_json):
+        if self.output_fd is not None and \
+                (self.count >= self.max_tasks or self.size + len(task_json) + 2 > self.max_bytes):
+            self.close_shard()
+        if self.output_fd is None:
+            self.open_shard()
+            self.output_fd.write(task_json)
+        else:
+            self.output_fd.write(",\n")
+            self.output_fd.write(task_json)
+        self.count += 1
+        self.size += len(task_json) + 2
+
+    def open_shard(self):
+        shard_name = f"{self.name}_{len(self.shards):04d}"
+        path = os.path.join(self.output_dir, f"{shard_name}.json")
+        self.output_fd = open(path, "w")
+        self.output_fd.write('{"tasks": [\n')
+        self.count = 0
+        self.size = len('{"tasks": [\n') + len("\n]}\n")
+        self.shards.append((shard_name, path))
+
+    def close_shard(self):
+        self.output_fd.write("\n]}\n")
+        self.output_fd.close()
+        self.output_fd = None
+        if self.on_shard is not None:
+            self.on_shard(*self.shards[-1])
+
+    def abort(self):
+        # The partial shard is left on disk, but not handed to on_shard.
+        if self.output_fd is not None:
+            self.output_fd.close()
+            self.output_fd = None
+
+    def close(self):
+        """
+        return: list of (shard name, path)
+        """
+        if self.output_fd is not None:
+            self.close_shard()
+        return self.shards
+
+
+def build_taskset(documents_path, template_path, output_dir, name, max_tasks=DEFAULT_MAX_TASKS,
+                  max_bytes=DEFAULT_MAX_BYTES, processes=1, on_shard=None):
+    """
+    on_shard: called with (shard name, path) as soon as a shard is complete, e.g. to upload it while the next
+    shards are being built.
+    return: (number of tasks, list of (shard name, path))
+    """
+    with open(template_path) as template_input:
+        template = json.load(template_input)
+    if isinstance(template, dict) and isinstance(template.get("tasks"), list) and len(template["tasks"]) == 1:
+        # A taskset definition with a single task, like the ones `create task/...` takes.
+        template = template["tasks"][0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    writer = ShardWriter(output_dir, name, max_tasks=max_tasks, max_bytes=max_bytes, on_shard=on_shard)
+    count = 0
+    try:
+        for task_json in iter_tasks(iter_documents(documents_path), template, processes=processes):
+            writer.write(task_json)
+            count += 1
+    except BaseException:
+        writer.abort()
+        raise
+    return count, writer.close()
+
+
+def upload_shard(tasksets, shard_name, path):
+    with open(path, "rb") as shard_input:
+        if tasksets.update(shard_name, shard_input) is None:
+            raise ValueError(f"Cannot upload shard {shard_name} to {tasksets.get_url(shard_name)}")
+    return shard_name
@@ -0,0 +1,34 @@
+import pytest
+
+from analytics import AnswerTable, analyze
+
+
+def response(worker_id, answers):
+    record = {"answers": [{"question_id": q, "answer": a} for q, a in answers]}
+    if worker_id is not None:
+        record["worker_id"] = worker_id
+    return record
+
+
+def test_grades_of_workers():
+    table = AnswerTable([response("W1", [("q1", "a"), ("q2", "b")]), response("W2", [("q1", "a"), ("q2", "c")])])
+    result = analyze(table, gold={"q1": "a", "q2": "b"})
+    assert {g["worker_id"]: g["grade"] for g in result["grades"]} == {"W1": 1.0, "W2": 0.5}
+
+
+def test_response_without_worker_id_is_rejected():
+    with pytest.raises(ValueError, match="worker_id"):
+        AnswerTable([response("W1", [("q1", "a")]), response(None, [("q1", "a")])])
+
+
+def test_response_with_null_worker_id_is_rejected():
+    record = response("W1", [("q1", "a")])
+    record["worker_id"] = None
+    with pytest.raises(ValueError, match="worker_id"):
+        AnswerTable([record])
+
+
+def test_mapped_fields():
+    records = [{"worker": "W1", "answers": [{"qid": "q1", "answer": "a"}]}]
+    table = AnswerTable(records, fields={"worker": "worker", "question": "qid"})
+    assert analyze(table)["grades"] == [{"worker_id": "W1", "grade": 1.0}]
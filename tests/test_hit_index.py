@@ -0,0 +1,76 @@
+from fake_mturk import FakeMTurk
+
+import mturk_utils
+from hit_index import HitIndex
+
+
+def create_hits(fake, count):
+    for i in range(count):
+        fake.create_hit(Title="t", Description="d", Reward="0.01", LifetimeInSeconds=3600,
+                        AssignmentDurationInSeconds=600, Question=f"<q>{len(fake.hits)}</q>")
+
+
+class NewestFirstMTurk(FakeMTurk):
+    def list_hits(self, **kwargs):
+        self._call('ListHITs')
+        with self.lock:
+            items = [dict(self.hits[hit_id]) for hit_id in reversed(self.hit_order)]
+        items, page = self._page(items, **kwargs)
+        page['HITs'] = items
+        return page
+
+
+def refresh_after_new_hits(fake, tmp_path):
+    index = HitIndex(str(tmp_path / "hits.sqlite"))
+    create_hits(fake, 1000)
+    assert index.refresh(fake) == 1000
+    create_hits(fake, 5)
+    before = fake.calls['ListHITs']
+    index.refresh(fake)
+    calls = fake.calls['ListHITs'] - before
+    assert len(index.hits()) == 1005
+    return calls
+
+
+def test_refresh_creation_order_is_incremental(tmp_path):
+    # The first page, then the last page of the previous refresh and the page of the new HITs.
+    assert refresh_after_new_hits(FakeMTurk(), tmp_path) <= 3
+
+
+def test_refresh_newest_first_is_incremental(tmp_path):
+    # The page of the new HITs and the first page without any, then the end of the listing.
+    assert refresh_after_new_hits(NewestFirstMTurk(), tmp_path) <= 4
+
+
+def test_refresh_without_new_hits(tmp_path):
+    fake = FakeMTurk()
+    index = HitIndex(str(tmp_path / "hits.sqlite"))
+    create_hits(fake, 250)
+    index.refresh(fake)
+    before = fake.calls['ListHITs']
+    index.refresh(fake)
+    assert fake.calls['ListHITs'] - before <= 2
+
+
+def test_refresh_falls_back_to_full_listing_on_rejected_token(tmp_path):
+    fake = FakeMTurk()
+    index = HitIndex(str(tmp_path / "hits.sqlite"))
+    create_hits(fake, 250)
+    index.refresh(fake)
+    with index.conn:
+        index._set_meta('tail_token', 'not-a-token')
+    create_hits(fake, 5)
+    index.refresh(fake)
+    assert len(index.hits()) == 255
+
+
+def test_list_hits_with_groupid_without_refresh(tmp_path):
+    fake = FakeMTurk()
+    index = HitIndex(str(tmp_path / "hits.sqlite"))
+    create_hits(fake, 10)
+    index.refresh(fake)
+    group_id = next(iter(fake.hits.values()))['HITGroupId']
+    before = fake.calls['ListHITs']
+    hit_ids, _ = mturk_utils.list_hits_with_groupid(fake, group_id, index=index, refresh=False)
+    assert len(hit_ids) == 10
+    assert fake.calls['ListHITs'] == before
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+from click.testing import CliRunner
+from fake_mturk import FakeMTurk, install
+
+import mturk_cli
+from launch_journal import LaunchJournal
+from mturk_utils import is_duplicate_request
+
+MTURK_CONFIG = {'sandbox': True, 'lifetime_min': '60', 'session_duration_min': '30', 'auto_approval_min': '60',
+                'reward_per_hit': 0.1, 'require_master': False, 'require_US': False, 'other_qualifications': [],
+                'num_of_hits': 1}
+META = {'title': 't', 'description': 'd', 'keywords': 'k'}
+
+
+def test_is_duplicate_request_reads_the_turk_error_code():
+    fake = FakeMTurk()
+    fake.create_hit(Title='t', Description='d', Reward='0.1', LifetimeInSeconds=60, AssignmentDurationInSeconds=60,
+                    Question='q', UniqueRequestToken='token')
+    with pytest.raises(ClientError) as error:
+        fake.create_hit(Title='t', Description='d', Reward='0.1', LifetimeInSeconds=60,
+                        AssignmentDurationInSeconds=60, Question='q', UniqueRequestToken='token')
+    assert is_duplicate_request(error.value)
+    message_only = ClientError({'Error': {'Code': 'RequestError', 'Message': 'AWS.MechanicalTurk.HitAlreadyExists'}},
+                               'CreateHIT')
+    assert not is_duplicate_request(message_only)
+
+
+def test_resume_recovers_hits_created_before_an_interruption(tmp_path):
+    fake = FakeMTurk()
+    journal = LaunchJournal(str(tmp_path / "launch.jsonl"))
+    jobs = [(f"https://crowdaq.example/task/{i}", 0) for i in range(6)]
+    # Created, but the launch stopped before recording them.
+    for url, replica in jobs[:3]:
+        mturk_cli.create_hit_for_url(fake, url, MTURK_CONFIG, META, [], journal.request_token(url, replica))
+    journal.close()
+
+    journal = LaunchJournal(str(tmp_path / "launch.jsonl"), resume=True)
+    _, _, failures = mturk_cli.create_hits(fake, jobs, MTURK_CONFIG, META, [], 4, journal)
+    journal.close()
+    assert not failures
+    assert len(fake.hits) == 6
+    assert journal.launched() == set(jobs)
+
+
+def launch(tmp_path, urls, *args, confirm=True):
+    config_file = tmp_path / "mturk.json"
+    config_file.write_text(json.dumps({"mturk_config": MTURK_CONFIG, "meta": META}))
+    url_file = tmp_path / "urls.txt"
+    url_file.write_text("".join(f"{url}\n" for url in urls))
+    return CliRunner().invoke(mturk_cli.cli, ["launch-task", str(config_file), "--url_file", str(url_file),
+                                              "--journal", str(tmp_path / "launch.jsonl"), *args], input="\n" if confirm else "")
+
+
+def test_resumed_launch_confirms_only_the_hits_left(tmp_path):
+    fake = install(FakeMTurk())
+    urls = [f"https://crowdaq.example/task/{i}" for i in range(4)]
+    assert launch(tmp_path, urls[:2]).exit_code == 0
+    result = launch(tmp_path, urls, "--resume")
+    assert result.exit_code == 0
+    before_prompt = result.output.split("Now please go to these links")[0]
+    assert "2 HIT(s) were already launched, 2 left." in before_prompt
+    assert f"Expected cost: ${mturk_cli.expected_cost(MTURK_CONFIG, 2):.2f}" in before_prompt
+    assert urls[0] not in before_prompt and urls[3] in before_prompt
+    assert len(fake.hits) == 4
+
+
+def test_declined_launch_leaves_no_journal(tmp_path):
+    fake = install(FakeMTurk())
+    result = launch(tmp_path, ["https://crowdaq.example/task/0"], confirm=False)
+    assert result.exit_code != 0
+    assert not (tmp_path / "launch.jsonl").exists()
+    assert not fake.hits
+
+
+def test_count_outstanding_assignments():
+    from mturk_utils import count_outstanding_assignments
+
+    fake = FakeMTurk()
+    urls = [f"https://crowdaq.example/task/{i}?a=1&b=2" for i in range(3)]
+    hits = [mturk_cli.create_hit_for_url(fake, url, MTURK_CONFIG, META, [])['HIT'] for url in urls + urls[:1]]
+    fake.add_assignments(hits[1]['HITId'], 1)
+    fake.update_expiration_for_hit(HITId=hits[2]['HITId'], ExpireAt=0)
+    assert count_outstanding_assignments(fake, urls) == {urls[0]: 2}
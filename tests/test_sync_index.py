@@ -0,0 +1,43 @@
+import os
+
+from sync_index import SyncIndex
+from sync_store import open_writer
+
+
+def sync(folder, pids, compression="gzip"):
+    index = SyncIndex.load(folder)
+    index.refresh()
+    writer = open_writer("jsonl", folder, index, compression=compression)
+    for pid in pids:
+        writer.write({"pid": pid, "answers": []})
+    files = writer.close()
+    index.save()
+    return files
+
+
+def test_truncated_shard_keeps_earlier_records(tmp_path):
+    folder = str(tmp_path)
+    shard, = sync(folder, range(452))
+    assert sync(folder, range(452, 500)) == [shard]
+    # An append interrupted in the middle of its gzip member.
+    path = os.path.join(folder, shard)
+    with open(path, "rb+") as shard_fd:
+        shard_fd.truncate(os.path.getsize(path) - 20)
+
+    index = SyncIndex.load(folder)
+    index.rebuild()
+    entry = index.files[shard]
+    assert not entry['complete']
+    assert set(range(452)) <= index.pids()
+
+
+def test_truncated_shard_is_not_appended_to(tmp_path):
+    folder = str(tmp_path)
+    shard, = sync(folder, range(100))
+    path = os.path.join(folder, shard)
+    with open(path, "rb+") as shard_fd:
+        shard_fd.truncate(os.path.getsize(path) - 5)
+    index = SyncIndex.load(folder)
+    index.rebuild()
+    index.save()
+    assert shard not in sync(folder, range(100, 110))
@@ -0,0 +1,33 @@
+from sync_index import SyncIndex
+from sync_store import iter_records, open_writer
+
+
+def sync(folder, records, output_format="jsonl"):
+    index = SyncIndex.load(folder)
+    index.refresh()
+    writer = open_writer(output_format, folder, index)
+    for record in records:
+        writer.write(record)
+    writer.close()
+    index.save()
+
+
+def test_iter_records_yields_each_pid_once_as_last_written(tmp_path):
+    folder = str(tmp_path)
+    sync(folder, [{"pid": pid, "version": 1} for pid in range(10)], output_format="json")
+    sync(folder, [{"pid": pid, "version": 2} for pid in range(5, 15)])
+    sync(folder, [{"pid": pid, "version": 3} for pid in range(12, 15)])
+
+    records = list(iter_records(folder))
+    assert sorted(record["pid"] for record in records) == list(range(15))
+    versions = {record["pid"]: record["version"] for record in records}
+    assert versions == {**{pid: 1 for pid in range(5)}, **{pid: 2 for pid in range(5, 12)},
+                        **{pid: 3 for pid in range(12, 15)}}
+
+
+def test_iter_records_without_a_saved_index(tmp_path):
+    folder = str(tmp_path)
+    sync(folder, [{"pid": pid} for pid in range(3)])
+    sync(folder, [{"pid": pid} for pid in range(3)])
+    (tmp_path / "crowdaq_sync_index.json").unlink()
+    assert sorted(record["pid"] for record in iter_records(folder)) == [0, 1, 2]
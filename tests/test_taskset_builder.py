@@ -0,0 +1,23 @@
+import io
+
+import pytest
+
+from taskset_builder import iter_json_array
+
+
+def test_iter_json_array_across_chunks():
+    text = '[{"a": 1}, {"b": "x, y"}, 12, true]'
+    assert list(iter_json_array(io.StringIO(text), chunk_size=4)) == [{"a": 1}, {"b": "x, y"}, 12, True]
+
+
+def test_invalid_json_fails_at_its_offset_without_reading_the_rest():
+    text = '[{"a": 1}, {"b" 2}, ' + '{"c": 3}, ' * 10000 + ']'
+    documents = io.StringIO(text)
+    with pytest.raises(ValueError, match="at byte 16"):
+        list(iter_json_array(documents, chunk_size=8))
+    assert documents.tell() < 100
+
+
+def test_truncated_array():
+    with pytest.raises(ValueError, match="Unexpected end"):
+        list(iter_json_array(io.StringIO('[{"a": 1}, {"b": "abc'), chunk_size=8))